@@ -0,0 +1,245 @@
+# benchmarks for pub.py, run against made-up season pages (so the real website never gets bothered)
+#
+#   python bench.py                         run everything and compare against the saved baseline, if there is one
+#   python bench.py --save                  ...and keep these numbers as the new baseline
+#   python bench.py --seasons 100 --teams 30 --weeks 13 --repeat 5
+#   python bench.py --latency 0.05         make the stand-in website take a while to answer, like the real one
+#
+# every benchmark runs in a scratch directory with its own database and page files, and the best of --repeat runs counts.
+import pub
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import http.server
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+REGRESSION_THRESHOLD = 1.25     # flag anything that's gotten this many times slower than the baseline
+LOCATION = pub.DEFAULT_LOCATION
+
+# teams to make pages out of, each with the ways the website has spelled it (so NORMALIZED gets a workout too).
+# past these, teams are just made up.
+TEAM_SPELLINGS = [["xeditors", "Xeditors"], ["the photons", "Photons"], ["never question howard", "never qestion howard", "Never Question  Howard"],
+                  ["e=mc hammer", "e=m c hammer"], ["beer swillers", "beerswillers"], ["chaos theory", "choaos theory"],
+                  ["audrey cointreau", "audrey ciontreau"], ["50 shades of gary", "50 shades of gray", "50shades of gary"], ["the honeymooners", "honeymooners"]]
+
+# the colors each rank gets on the website, best first
+RANK_COLORS = [color for (color, rank) in sorted(pub.RANKS.items(), key=lambda item: item[1])]
+
+# a season page, in the same markup the website uses: a row per team, with a <td align="left"> for the team's name,
+# a <td> per week (colored by placement, for the top finishers), and the season total in a <td align="center">.
+# the last <unplayed> weeks haven't happened yet (everybody's got a zero), like the current season on the real site.
+def season_page(season, teams=12, weeks=13, unplayed=0, seed=0):
+    rnd = random.Random(seed * 100003 + season)
+    names = [rnd.choice(spellings) for spellings in TEAM_SPELLINGS[:teams]] + ["team {:d}".format(n) for n in range(teams - len(TEAM_SPELLINGS))]
+    rnd.shuffle(names)
+
+    scores = [[0] * weeks for team in range(teams)]
+    ranks = [[-1] * weeks for team in range(teams)]
+    for week in range(weeks - unplayed):
+        present = [team for team in range(teams) if rnd.random() < 0.8]
+        for team in present:
+            scores[team][week] = rnd.randint(20, 90)
+        for (place, team) in enumerate(sorted(present, key=lambda team: -scores[team][week])):
+            ranks[team][week] = place + 1
+
+    html = ['<html>\n<head><title>Pub Profile</title></head>\n<body>\n<table>\n']
+    html.append('<tr>\n<td align="left" colspan="{:d}">Season {:d} Standings</td>\n</tr>\n'.format(weeks + 2, season))   # not a team
+    for team in range(teams):
+        html.append('<tr>\n<td align="left">{:s}</td>\n'.format(names[team]))
+        for week in range(weeks):
+            if (1 <= ranks[team][week] <= len(RANK_COLORS)):
+                html.append('<td style="color:#{:s}">{:d}</td>\n'.format(RANK_COLORS[ranks[team][week] - 1], scores[team][week]))
+            else:
+                html.append('<td>{:d}</td>\n'.format(scores[team][week]))
+        html.append('<td align="center">{:.1f}</td>\n</tr>\n'.format(float(sum(scores[team]))))
+    html.append('</table>\n<p>&copy; PubStumpers</p>\n</body>\n</html>\n')
+    return("".join(html).encode())
+
+# every season's page, all made ahead of time so the benchmarks only time what pub.py does with them
+def make_pages(seasons, teams, weeks, seed=0):
+    return(dict((season, season_page(season, teams, weeks, 2 if season == seasons else 0, seed)) for season in range(1, seasons + 1)))
+
+# a stand-in for the website, serving <pages> from memory (after <latency> seconds).  returns the server and the pub profile URL to give pub.py.
+def serve_pages(pages, latency=0.0):
+    class PageHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            season = int(self.path.rsplit("season=", 1)[-1]) if "season=" in self.path else 0
+            if (season not in pages):
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(pages[season])))
+            self.end_headers()
+            self.wfile.write(pages[season])
+
+        def log_message(self, *args):
+            pass
+
+    class PageServer(http.server.ThreadingHTTPServer):
+        request_queue_size = 64     # the default (5) makes every download past the fifth at once wait a second to get connected
+
+    server = PageServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return(server, "http://127.0.0.1:{:d}/index.cfm?DocID=Pub%20Profile&cn=0".format(server.server_port))
+
+# run <run> <repeat> times (each with a fresh result from <setup>, which doesn't count) and return the quickest, in seconds
+def best_of(repeat, run, setup=lambda: None):
+    times = []
+    for attempt in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return(min(times))
+
+# a database with every season in it, ready for whatever comes after parsing
+def parsed_database(seasons, path):
+    db = pub.Database(path, reset=True)
+    for season in range(1, seasons + 1):
+        pub.parse_season(db, LOCATION, season)
+    return(db)
+
+# get_averages the way it used to be done (before it worked off the snapshot): a handful of queries for every season.
+# kept here so there's something to hold the new one up against.  (ties for the season win go to the first team
+# alphabetically, same as the new one, so the two can be checked against each other.)
+def per_season_averages(db, location):
+    retval = []
+    c = db.conn.cursor()
+    for season in reversed(pub.get_seasons(db, location)):
+        max_total = 0.0
+        num_weeks = 0
+        for (week,) in c.execute("SELECT DISTINCT week FROM weekly_results WHERE location=? AND season=?", [location, season]).fetchall():
+            (max_score_for_week,) = c.execute("SELECT MAX(score) FROM weekly_results WHERE location=? AND season=? AND week=?", [location, season, week]).fetchone()
+            if (max_score_for_week > 0):
+                max_total += max_score_for_week
+                num_weeks += 1
+        (winning_team,) = c.execute("SELECT team FROM season_results WHERE location=? AND season=? ORDER BY score DESC, team LIMIT 1", [location, season]).fetchone()
+        (average_winner_score,) = c.execute("SELECT AVG(score) FROM weekly_results WHERE location=? AND season=? AND team=?", [location, season, winning_team]).fetchone()
+        if (num_weeks == 0 or average_winner_score is None):
+            continue
+        retval.append((season, "{:.2f}".format(max_total / num_weeks), "{:.2f}".format(average_winner_score)))
+    return(retval)
+
+def run_benchmarks(seasons, teams, weeks, repeat, latency=0.0):
+    pages = make_pages(seasons, teams, weeks)
+    (server, url) = serve_pages(pages, latency)
+    pub.LOCATIONS = {LOCATION: url}
+    results = {}
+
+    workdir = tempfile.mkdtemp(prefix="pubbench")
+    start_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        # fetching: every season, over HTTP, from scratch (no cache, nothing in the archive from last time)
+        def fresh_fetch():
+            pub.page_cache = {}
+            pub.archive_index = None
+            shutil.rmtree(pub.PAGE_ARCHIVE, ignore_errors=True)
+        results["get_season"] = best_of(repeat, lambda state: pub.fetch_seasons([(LOCATION, season) for season in range(1, seasons + 1)], True), fresh_fetch)
+
+        # parsing: HTML to rows, with each backend there is, then rows into the database (from the pages, then from what parsing them saved)
+        texts = []
+        for season in range(1, seasons + 1):
+            with pub.open_page(LOCATION, season) as fh:
+                texts.append(fh.read())
+        for backend in ("lxml", "bs4"):
+            if (backend == "lxml" and pub.lxml is None):
+                continue
+            results["extract_season_rows/" + backend] = best_of(repeat, lambda state: [pub.extract_season_rows(LOCATION, season, text, backend)
+                                                                                       for (season, text) in enumerate(texts, 1)])
+
+        def fresh_database():
+            db = pub.Database("bench.db", reset=True)
+            db.conn
+            return(db)
+        def fresh_database_and_cache():
+            shutil.rmtree(pub.PARSE_CACHE, ignore_errors=True)
+            return(fresh_database())
+        results["parse_season"] = best_of(repeat, lambda db: [pub.parse_season(db, LOCATION, season) for season in range(1, seasons + 1)], fresh_database_and_cache)
+        results["parse_season/cached"] = best_of(repeat, lambda db: [pub.parse_season(db, LOCATION, season) for season in range(1, seasons + 1)], fresh_database)
+
+        # a whole rebuild from nothing: downloading every page and then parsing them all, or both at once
+        location_seasons = [(LOCATION, season) for season in range(1, seasons + 1)]
+        def from_nothing():
+            fresh_fetch()
+            return(fresh_database_and_cache())
+        results["rebuild/phased"] = best_of(repeat, lambda db: (pub.fetch_seasons(location_seasons, True), pub.parse_seasons(db, location_seasons)), from_nothing)
+        results["rebuild/streamed"] = best_of(repeat, lambda db: pub.stream_seasons(db, location_seasons, True), from_nothing)
+        # ...and again, with every page already archived and parsed (nothing's changed on the website since)
+        results["rebuild/phased/unchanged"] = best_of(repeat, lambda db: (pub.fetch_seasons(location_seasons, True), pub.parse_seasons(db, location_seasons)), fresh_database)
+        results["rebuild/streamed/unchanged"] = best_of(repeat, lambda db: pub.stream_seasons(db, location_seasons, True), fresh_database)
+
+        results["clean_database"] = best_of(repeat, lambda db: pub.clean_database(db), lambda: parsed_database(seasons, "bench.db"))
+
+        # analysis: summaries from scratch, every streak, reading in every result, then the whole report (with nothing cached)
+        db = parsed_database(seasons, "bench.db")
+        pub.clean_database(db)
+        results["refresh_summaries"] = best_of(repeat, lambda state: pub.refresh_summaries(db), lambda: pub.set_summary_state(db, "", "stale", 1))
+        results["get_streaks"] = best_of(repeat, lambda state: pub.get_streaks(db, LOCATION, None))
+        results["snapshot"] = best_of(repeat, lambda state: pub.Snapshot(db, LOCATION))
+        def forget_reports():
+            pub.cached_table_rows.cache_clear()
+            pub.cached_snapshot.cache_clear()
+        if (pub.get_averages(db, LOCATION) != per_season_averages(db, LOCATION)):
+            raise AssertionError("get_averages doesn't agree with the per-season version")
+        results["get_averages/per_season"] = best_of(repeat, lambda state: per_season_averages(db, LOCATION))
+        results["get_averages"] = best_of(repeat, lambda state: pub.get_averages(db, LOCATION))     # the snapshot's shared with the rest of the report...
+        results["get_averages/cold"] = best_of(repeat, lambda state: pub.get_averages(db, LOCATION), forget_reports)    # ...unless it's the first thing to need it
+        results["render_report"] = best_of(repeat, lambda state: pub.page_bytes(pub.render_report(db, LOCATION)), forget_reports)
+        db.close()
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(workdir)
+        server.shutdown()
+    return(results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmarks for pub.py, against made-up season pages")
+    parser.add_argument("--seasons", type=int, default=44)
+    parser.add_argument("--teams", type=int, default=20)
+    parser.add_argument("--weeks", type=int, default=13)
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of this many runs (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the stand-in website takes to answer each request (default: %(default)s)")
+    parser.add_argument("--save", action="store_true", help="save these numbers as the baseline in " + BASELINE_FILE)
+    args = parser.parse_args(argv)
+
+    scale = {"seasons": args.seasons, "teams": args.teams, "weeks": args.weeks, "latency": args.latency}
+    results = run_benchmarks(args.seasons, args.teams, args.weeks, args.repeat, args.latency)
+
+    baseline = {}
+    if (os.path.exists(BASELINE_FILE)):
+        with open(BASELINE_FILE) as fh:
+            saved = json.load(fh)
+        if (saved["scale"] == scale):
+            baseline = saved["results"]
+        else:
+            print("(baseline was made at a different scale: {:s}; not comparing)".format(json.dumps(saved["scale"])))
+
+    print("{:d} seasons x {:d} teams x {:d} weeks, {:.3f}s latency, best of {:d}".format(args.seasons, args.teams, args.weeks, args.latency, args.repeat))
+    print("{:<28s} {:>10s} {:>10s} {:>8s}".format("benchmark", "seconds", "baseline", "ratio"))
+    regressions = 0
+    for (name, seconds) in results.items():
+        if (name in baseline):
+            ratio = seconds / baseline[name]
+            flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+            regressions += (ratio > REGRESSION_THRESHOLD)
+            print("{:<28s} {:>10.4f} {:>10.4f} {:>7.2f}x{:s}".format(name, seconds, baseline[name], ratio, flag))
+        else:
+            print("{:<28s} {:>10.4f} {:>10s} {:>8s}".format(name, seconds, "-", "-"))
+
+    if (args.save):
+        with open(BASELINE_FILE, "w") as fh:
+            json.dump({"scale": scale, "results": results}, fh, indent=1)
+        print("saved as the new baseline")
+    return(1 if regressions else 0)
+
+if (__name__ == "__main__"):
+    sys.exit(main())
@@ -1,26 +1,124 @@
-from bs4 import BeautifulSoup
+# pubstumpers trivia results -> a database -> a page (or a server) full of stats about them.
+#
+# run it:            python pub.py [--profile]  |  python pub.py serve [port]  |  python pub.py watch
+# use it as a library: import pub; db = pub.Database(); pub.Pipeline(db).run()  (nothing happens on import)
+#
+# it's all one file on purpose: the settings right below are meant to be edited in place, and everything reads them
+# at the time it runs (a default of None means "whatever the setting is right then"), so `pub.SOMETHING = ...`
+# (which is what bench.py and test_pub.py do) changes it everywhere.  the exceptions get used up on import:
+# DATA_SOURCE (it's already in LOCATIONS by then; change LOCATIONS instead), REPORT_CACHE_SIZE and SNAPSHOT_CACHE_SIZE.
+# what's where, top to bottom:
+#   settings                      everything in CAPITALS, then the team name fix-ups (RANKS, NORMALIZED, OVERRIDES)
+#   fetching                      download_page, the page archive (archive_page, open_page), get_season, fetch_seasons
+#   parsing                       read_team_rows_*, extract_season_rows, the parse cache, parse_seasons, stream_seasons
+#   the database                  Database, connect_database, MIGRATIONS, sync_season, clean_database
+#   summaries                     refresh_summaries and friends (team totals, season winners, streaks)
+#   report tables                 Snapshot, get_streaks, get_averages..., REPORT_TABLES, LEADERBOARD_TABLES
+#   rendering and serving         render_report, render_leaderboard, render_json, write_page, report_app, serve
+#   running it                    Pipeline (one stage at a time), Watcher (keeps polling), main
 import os
 import re
 import urllib.request
+import urllib.error
 import sqlite3
 import operator
+import itertools
+import heapq
+import array
+import struct
 import datetime
+import time
+import concurrent.futures
+import multiprocessing
+import threading
+import queue
+import hashlib
+import json
+import gzip
+import functools
+import html
+import urllib.parse
+import wsgiref.simple_server
+import socketserver
+import sys
+import argparse
+import contextlib
+import cProfile
+
+try:
+    import lxml.html        # optional: a whole lot faster at chewing through season pages than BeautifulSoup
+    import lxml.etree
+except ImportError:
+    lxml = None
 
 HTMLFILE = "index.html"
 VERBOSE = False           # yap about things as they're being worked through
 RESET_DATABASE = False    # recreate database from scratch (instead of querying what we've got)
 PURGE_LAST_SEASON = True  # no need to recreate the whole database from scratch.  just burn and re-parse the last season's page
-LAST_SEASON = 44          # clunky, but easier than trying to load pages until I get a 404
+INCREMENTAL_INGEST = True # instead of burning the last season, only write the rows that actually changed
+LAST_SEASON = 44          # where to start looking for the newest season (and what to fall back on if the website can't be reached)
+                          # (same guess for every location)
+DISCOVER_LAST_SEASON = True   # ask the website what the newest season is, instead of trusting LAST_SEASON
+LAST_SEASON_CACHE = "last_season.json"   # remembers what the newest season was, and when we last checked
+LAST_SEASON_TTL = 6 * 60 * 60            # seconds before we bother the website about the newest season again
 DATABASE = "trivia.db"
+PARSE_WORKERS = os.cpu_count() or 1   # how many processes to parse season pages with
+PARSER_BACKEND = "lxml"   # "lxml" (falls back to BeautifulSoup if lxml isn't installed) or "bs4"
+FAST_REBUILD = True       # when rebuilding, use a write-ahead log and fewer fsyncs (PRAGMA journal_mode=WAL, synchronous=NORMAL)
+PAGE_CACHE = "pages.json" # remembers ETag/Last-Modified/content hash for each location's season pages we've ingested
+PAGE_ARCHIVE = "pages"    # directory with every version of every season page ever downloaded, gzipped (see archive_page)
+PARSE_CACHE = "parsed"    # directory that keeps the rows each season page turned into, so an unchanged page never gets parsed twice (None to always parse)
+PARSE_CACHE_FORMAT = 1    # bump this whenever pages start turning into different rows, so nothing parsed the old way gets used
 SELECTED_TEAM = "xeditors"                          # edit to highlight your own team, if you'd like!
-SELECTED_TEAM = SELECTED_TEAM.replace("'", "''")    # to make the SQL queries happy
 DATA_SOURCE = "http://pubs.pubstumpers.com/index.cfm?DocID=Pub%20Profile&cn=68"   # edit to reflect your own location as needed
+# every pub to keep track of (all in the one database): a short name for it -> its pub profile page
+# the short name shows up in file names and in the database, so keep it simple and don't change it once it's in use
+LOCATIONS = {
+    "cn68": DATA_SOURCE,
+}
+DEFAULT_LOCATION = "cn68" # results from before there were locations belong to this one, and its report goes in HTMLFILE
+LEADERBOARD_FILE = "leaderboard.html"   # with more than one location: every location's teams, side by side
 color_regex = re.compile("color:#(......)")
+team_cell_regex = re.compile(rb'<td[^>]*align="?left', re.IGNORECASE)
+
+# download knobs (mostly matter for RESET_DATABASE, where every season gets pulled down)
+FETCH_WORKERS = 8         # how many season pages to download at the same time
+FETCH_TIMEOUT = 30        # seconds to wait on the website before giving up on an attempt
+FETCH_RETRIES = 3         # how many more times to try a download after the first one fails
+FETCH_BACKOFF = 1.0       # seconds to wait before the first retry.  doubles with every retry after that.
+STREAM_INGEST = True      # when rebuilding, parse pages as they come in and write their rows as they're parsed, instead of one step at a time (see stream_seasons)
+STREAM_QUEUE = 8          # how many pages can be waiting between one step of that and the next before the step before has to hold up
+STREAM_BATCH = 8          # how many seasons' rows go in each transaction, when streaming
 
 # cosmetic constants
 TITLE_BGCOLOR = "333333"
 TITLE_TEXTCOLOR = "ffffff"
 CELL_TEXTCOLOR = "000000"
+PAGE_START = '<HTML>\n<HEAD>\n<TITLE>{:s}</TITLE>\n</HEAD>\n<BODY BGCOLOR="999999" TEXT="000000" LINK="CCCCCC" VLINK="CCCCCC" ALINK="FFFFFF">\n'
+PAGE_END = '</BODY>\n</HTML>\n'
+TABLE_START = ('<TABLE BORDER=1 CELLPADDING=3 CELLSPACING=4 BGCOLOR="eeeeee">\n'
+               '<TR>\n<TH BGCOLOR="' + TITLE_BGCOLOR + '" ALIGN="CENTER" COLSPAN={:d}><FONT COLOR="' + TITLE_TEXTCOLOR + '">{:s}</FONT></TH>\n</TR>\n')
+
+# report rendering knobs
+REPORT_CHUNK_ROWS = 256   # how many table rows to gather up before handing them on to wherever the page is going
+REPORT_BUFFER = 65536     # bytes of report to hold on to before each write to disk
+STREAK_LIMIT = 20         # how many of the longest streaks ever make the report (None for every streak there's ever been)
+REPORT_CACHE_SIZE = 256   # how many report tables' worth of query results to keep in memory (see cached_table_rows)
+SNAPSHOT_CACHE_SIZE = 8   # how many locations' results to keep in memory for the report tables that look over all of them (see Snapshot)
+REPORT_WORKERS = 4        # how many report tables to look up at the same time, each on a read-only connection of its own (1 to look them up one at a time)
+
+# "python pub.py --profile" keeps track of where a run's time goes (see Pipeline.run_record)
+PROFILE_LOG = "profile.jsonl"   # each profiled run adds a line of JSON to the end of this
+
+# "python pub.py serve [port]" serves the reports up out of the database instead of doing a run
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8068
+
+# "python pub.py watch" keeps the database open and checks the website for new results every so often (see Watcher)
+RESULTS_POSTED = [(1, 20, 24)]  # (weekday (Monday is 0), from hour, until hour) when new results usually turn up.  edit for your trivia night!
+                                # (an "until" past 24 runs on into the next day)
+WATCH_FAST_POLL = 5 * 60        # seconds between checks while results are usually turning up
+WATCH_SLOW_POLL = 6 * 60 * 60   # seconds between checks the rest of the time
 
 # map the color-coded placements on the website to their numerical ranks
 RANKS = {
@@ -33,6 +131,16 @@ RANKS = {
 
 TEAMS = {}
 
+page_cache = None
+page_cache_lock = threading.Lock()
+fetched_pages = {}      # page cache entries for pages downloaded but not ingested yet (see save_page_cache)
+archive_index = None    # "location/season" -> every version of that page, oldest first (see load_archive_index)
+archive_lock = threading.Lock()
+
+# bits of HTML the report tables are made of, kept around once they've been put together (see cell_text and row_template)
+cell_texts = {}
+row_templates = {}
+
 # push all the typo-strewn teams into the correctly unified bucket
 # 'malformed name': "actual team name"
 NORMALIZED = {
@@ -65,17 +173,19 @@ NORMALIZED = {
 }
 
 # data that overrides the actual scraped data
-# season -> team_name -> week -> (rank, score)
+# location -> season -> team_name -> week -> (rank, score)
 # use the normalized team name per the table above
 OVERRIDES = {
-	"38": {
-		"never question howard": { 12: (0, 67) },
-	},
-    "42": {
-        "e=mc hammer": { 9: (4, 65) },
-        "never question howard": { 9: (3, 69) },
-        "the photons": { 9: (2, 74) },
-        "xeditors": { 9: (1, 76) },
+    "cn68": {
+        "38": {
+            "never question howard": { 12: (0, 67) },
+        },
+        "42": {
+            "e=mc hammer": { 9: (4, 65) },
+            "never question howard": { 9: (3, 69) },
+            "the photons": { 9: (2, 74) },
+            "xeditors": { 9: (1, 76) },
+        }
     }
 }
 
@@ -99,12 +209,12 @@ def get_rank(html):
     else:
         return 0
 
-def override_values(season, team_name, week, rank, score):
+def override_values(location, season, team_name, week, rank, score):
     non_override = (season, team_name, week, rank, score)
-    if (not season in OVERRIDES):
+    if (not season in OVERRIDES.get(location, {})):
         return(non_override)
 
-    team_name_dict = OVERRIDES[season]
+    team_name_dict = OVERRIDES[location][season]
     if (not team_name in team_name_dict):
         return(non_override)
 
@@ -117,150 +227,1115 @@ def override_values(season, team_name, week, rank, score):
     return(season, team_name, week, new_rank, new_score)
 		
 		
-# get the HTML page for Season #<season> of PubStumpers trivia
-# if we already have a local file, don't attempt to redownload things.
-# otherwise: nab the missing file via HTTP
-def get_season(season, overwrite=False):
+# pull down a single URL, trying again (and waiting longer each time) if the website flakes out.
+# returns (page bytes, response headers), or (None, None) if the server says our copy is still good (HTTP 304)
+def download_page(url, headers=None):
+    request = urllib.request.Request(url, headers=(headers or {}))
+    delay = FETCH_BACKOFF
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+                return(response.read(), response.headers)
+        except urllib.error.HTTPError as e:
+            if (e.code == 304):
+                return(None, None)
+            if (e.code < 500 or attempt == FETCH_RETRIES):  # a 404 isn't going to fix itself by asking again
+                raise
+            print(("couldn't get {:s} ({:s}), trying again in {:.1f}s").format(url, str(e), delay))
+        except OSError as e:        # covers URLError and socket timeouts
+            if (attempt == FETCH_RETRIES):
+                raise
+            print(("couldn't get {:s} ({:s}), trying again in {:.1f}s").format(url, str(e), delay))
+        time.sleep(delay)
+        delay = delay * 2
+
+# the page cache remembers, for every season page we've ingested, what the server called it (ETag / Last-Modified)
+# and a hash of its contents.  that lets us ask "has this changed?" instead of blindly re-downloading and re-parsing.
+# "location/season" -> {"etag": ..., "last_modified": ..., "sha256": ...}
+def load_page_cache():
+    global page_cache
+    page_cache = {}
+    if (os.path.exists(PAGE_CACHE)):
+        with open(PAGE_CACHE) as fh:
+            page_cache = json.load(fh)
+
+# get_season doesn't touch the page cache itself: what it saw goes in fetched_pages, and only makes it into the
+# page cache (in memory and on disk) here.  so only call this once the pages have made it into the database.
+# if we die (or the run fails) between downloading and parsing, the stale cache makes sure the page gets parsed next time around.
+def save_page_cache():
+    with page_cache_lock:
+        page_cache.update(fetched_pages)
+        fetched_pages.clear()
+        with open(PAGE_CACHE + ".part", "w") as fh:
+            json.dump(page_cache, fh, indent=1, sort_keys=True)
+    os.replace(PAGE_CACHE + ".part", PAGE_CACHE)
+
+# forget whatever got downloaded since the last save_page_cache (it never made it into the database)
+def discard_fetched_pages():
+    with page_cache_lock:
+        fetched_pages.clear()
+
+# where a location's season page comes from, and where it used to live on disk (before there was a PAGE_ARCHIVE,
+# back when there was only the one location; None for any other location, which never had pages lying around)
+def season_url(location, season):
+    return(LOCATIONS[location] + "&season=" + str(season))
+
+def season_file(location, season):
+    if (location != DEFAULT_LOCATION):
+        return(None)
+    return("season{:s}.html".format(str(season)))
+
+# the page archive keeps every version of every season page we've downloaded, each one gzipped in a file named for
+# the SHA-256 of what's in it (so downloading the same page again costs nothing), plus an index of which versions each
+# season's page has had and when each one turned up.  any of them can be read back in without going near the website.
+#   PAGE_ARCHIVE/objects/ab/abcdef....html.gz
+#   PAGE_ARCHIVE/index.jsonl    a line per new version: {"page": "location/season", "sha256": ..., "fetched": ...}
+def load_archive_index():
+    global archive_index
+    index = {}
+    index_file = os.path.join(PAGE_ARCHIVE, "index.jsonl")
+    if (os.path.exists(index_file)):
+        with open(index_file) as fh:
+            for line in fh:
+                if (line.strip()):
+                    version = json.loads(line)
+                    index.setdefault(version["page"], []).append(version)
+    archive_index = index
+
+def archive_object(digest):
+    return(os.path.join(PAGE_ARCHIVE, "objects", digest[:2], digest + ".html.gz"))
+
+# put a season page's <data> in the archive, as that page's newest version (unless it's the same as the last one).
+# returns its SHA-256.
+def archive_page(location, season, data, fetched=None):
+    digest = hashlib.sha256(data).hexdigest()
+    path = archive_object(digest)
+    if (not os.path.exists(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = "{:s}.{:d}.part".format(path, threading.get_ident())    # never leave half a page lying around (and don't trip over another thread saving the same one)
+        with gzip.open(part, "wb", compresslevel=6) as fh:
+            fh.write(data)
+        os.replace(part, path)
+
+    page = location + "/" + str(season)
+    with archive_lock:
+        if (archive_index is None):
+            load_archive_index()
+        versions = archive_index.setdefault(page, [])
+        if (not versions or versions[-1]["sha256"] != digest):
+            version = {"page": page, "sha256": digest, "fetched": fetched or datetime.datetime.now().isoformat(timespec="seconds")}
+            versions.append(version)
+            with open(os.path.join(PAGE_ARCHIVE, "index.jsonl"), "a") as fh:
+                fh.write(json.dumps(version) + "\n")
+    return(digest)
+
+# every version of a season page in the archive, oldest first: [{"sha256": ..., "fetched": ...}, ...]
+# (a page still sitting loose in its season_file, from before there was an archive, gets moved in first)
+def page_versions(location, season):
+    page = location + "/" + str(season)
+    with archive_lock:
+        if (archive_index is None or page not in archive_index):
+            load_archive_index()        # (another process, like a parse worker's parent, might have archived it since we looked)
+        versions = archive_index.get(page, [])
+    loose = season_file(location, season)
+    if (not versions and loose is not None and os.path.exists(loose)):
+        with open(loose, "rb") as fh:
+            archive_page(location, season, fh.read(), datetime.datetime.fromtimestamp(os.path.getmtime(loose)).isoformat(timespec="seconds"))
+        os.remove(loose)
+        return(page_versions(location, season))
+    return(list(versions))
+
+# the SHA-256 of a version of a season page (the newest, unless <version> says which: the start of its SHA-256 will do),
+# or None if there's no such page in the archive
+def page_digest(location, season, version=None):
+    for archived in reversed(page_versions(location, season)):
+        if (version is None or archived["sha256"].startswith(version)):
+            return(archived["sha256"])
+    return(None)
+
+# a season page's text (see page_digest for which version), decompressed as it's read
+def open_page(location, season, version=None):
+    digest = page_digest(location, season, version)
+    if (digest is None):
+        raise missing_page(location, season, version)
+    return(gzip.open(archive_object(digest), "rt"))
+
+def missing_page(location, season, version=None):
+    return(FileNotFoundError("no {:s} season {:s} page{:s} in {:s}".format(location, str(season), "" if version is None else " " + version, PAGE_ARCHIVE)))
+
+# get the HTML page for Season #<season> of PubStumpers trivia at <location>, into the page archive
+# if we already have it, don't attempt to redownload things (unless told to overwrite it).
+# when overwriting, ask the server if the page changed since we last saw it.
+# returns True if the newest version of the page is new or different from what's been ingested, False otherwise.
+def get_season(location, season, overwrite=False):
     season = str(season)
-    output = "season" + season + ".html"
-    url = DATA_SOURCE + "&season=" + season
+    url = season_url(location, season)
+    cache_key = location + "/" + season
     
-    if (os.path.exists(output)):
-        if (overwrite):
-            print(("removing {:s} as requested").format(output))
-            os.remove(output)
-        elif (VERBOSE):
-            print("already have " + output +", ignoring request.")
-            return
+    with page_cache_lock:
+        cached = page_cache.get(cache_key, {})
+    headers = {}
+    if (page_digest(location, season) is not None):
+        if (not overwrite):
+            if (VERBOSE): print("already have " + location + " season " + season + ", ignoring request.")
+            return(False)
+        if ("etag" in cached):
+            headers["If-None-Match"] = cached["etag"]
+        if ("last_modified" in cached):
+            headers["If-Modified-Since"] = cached["last_modified"]
     
-    if (VERBOSE): print("getting season " + season + "... ")
-    urllib.request.urlretrieve(url, output)
+    if (VERBOSE): print("getting " + location + " season " + season + "... ")
+    (data, response_headers) = download_page(url, headers)
+    if (data is None):
+        if (VERBOSE): print(location + " season " + season + " hasn't changed (304).")
+        return(False)
+
+    entry = {"sha256": hashlib.sha256(data).hexdigest()}
+    if (response_headers.get("ETag")):
+        entry["etag"] = response_headers["ETag"]
+    if (response_headers.get("Last-Modified")):
+        entry["last_modified"] = response_headers["Last-Modified"]
+    with page_cache_lock:
+        fetched_pages[cache_key] = entry
+    archive_page(location, season, data)
+    if (entry["sha256"] == cached.get("sha256")):
+        if (VERBOSE): print(location + " season " + season + " came back identical, nothing to do.")
+        return(False)
+
     if (VERBOSE): print("done.")
+    return(True)
+
+# get the HTML pages for a whole list of (location, season) pairs, <workers> of them at a time (from every location at once)
+# every page still lands in the archive, so parse_season doesn't know or care how it got there
+# returns the (location, season) pairs whose pages are new or changed
+def fetch_seasons(location_seasons, overwrite=False, workers=None):
+    if (workers is None):
+        workers = FETCH_WORKERS
+    if (page_cache is None):
+        load_page_cache()
+
+    workers = max(1, min(workers, len(location_seasons)))
+    if (workers == 1):          # nothing to gain from a pool; keep it simple
+        changed = [get_season(location, season, overwrite) for (location, season) in location_seasons]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(get_season, location, season, overwrite) for (location, season) in location_seasons]
+            changed = [future.result() for future in futures]   # re-raise any download that failed for good
+    return([location_season for (location_season, is_changed) in zip(location_seasons, changed) if is_changed])
  
-# for a given season, look through its page of HTML and store the bits we care about in a database
-def parse_season(season):
-    # read the whole file into a single variable
+# does Season #<season> exist at <location> yet?  (a 404, or a page without any teams on it, means no.)
+def season_exists(location, season):
+    try:
+        (data, response_headers) = download_page(season_url(location, season))
+    except urllib.error.HTTPError as e:
+        if (e.code == 404):
+            return(False)
+        raise
+    return(team_cell_regex.search(data) is not None)
+
+# figure out the newest season on the website, starting from a guess (usually the last answer we got).
+# gallop away from the guess (1, 2, 4, 8... seasons) until we've bracketed the newest season, then binary search inside the bracket.
+# when the guess is right, that's two requests: "guess exists" and "guess+1 doesn't".
+# the answer gets remembered (per location) for LAST_SEASON_TTL seconds so most runs don't ask at all.
+def discover_last_season(location, hint):
+    all_cached = {}
+    if (os.path.exists(LAST_SEASON_CACHE)):
+        with open(LAST_SEASON_CACHE) as fh:
+            all_cached = json.load(fh)
+        if ("checked" in all_cached):   # from before there were locations; not worth trying to keep
+            all_cached = {}
+    if (location in all_cached):
+        cached = all_cached[location]
+        if (time.time() - cached["checked"] < LAST_SEASON_TTL):
+            if (VERBOSE): print("newest {:s} season is still {:d} (checked recently)".format(location, cached["season"]))
+            return(cached["season"])
+        hint = max(hint, cached["season"])     # seasons don't go away, so never start below what we've already seen
+
+    try:
+        # bracket the answer: <low> exists (or is 0, meaning "nothing does"), <high> doesn't
+        step = 1
+        if (season_exists(location, hint)):
+            (low, high) = (hint, hint + step)
+            while (season_exists(location, high)):
+                step = step * 2
+                (low, high) = (high, high + step)
+        else:
+            (low, high) = (hint - step, hint)
+            while (low >= 1 and not season_exists(location, low)):
+                step = step * 2
+                (low, high) = (low - step, low)
+            low = max(low, 0)
+
+        while (high - low > 1):
+            middle = (low + high) // 2
+            if (season_exists(location, middle)):
+                low = middle
+            else:
+                high = middle
+    except OSError as e:
+        print("couldn't work out the newest {:s} season ({:s}), sticking with season {:d}".format(location, str(e), hint))
+        return(hint)
+
+    if (low == 0):
+        print("couldn't find any {:s} seasons at all, sticking with season {:d}".format(location, hint))
+        return(hint)
+
+    if (VERBOSE): print("newest {:s} season is {:d}".format(location, low))
+    all_cached[location] = {"season": low, "checked": time.time()}
+    with open(LAST_SEASON_CACHE, "w") as fh:
+        json.dump(all_cached, fh)
+    return(low)
+
+# every parser backend boils a season page down to the same thing: for each team row, the team name as it appears
+# on the page, plus that row's score cells in order as (is_total, style, [text bits]) tuples.
+# what those cells actually mean gets worked out in extract_season_rows, so the backends can't disagree about it.
+
+# the original: let BeautifulSoup deal with parsing the train wreck of the trivia HTML.
+# lxml is the reference for what a row looks like: every element after the team cell, and nothing else, so this
+# walks the same cells whether or not there's whitespace (or comments) between them
+def read_team_rows_bs4(text):
+    from bs4 import BeautifulSoup, Tag      # only paid for when it's actually used
+    soup = BeautifulSoup(text, "html.parser")
+    for team_data in soup.find_all("td", align="left", colspan=None):     # get all the TD containing team names
+        cells = []
+        for score_data in team_data.next_siblings:                       # every weekly score, then the total
+            if (isinstance(score_data, Tag)):
+                cells.append((score_data.has_attr('align'), score_data.get('style'), list(score_data.stripped_strings)))
+        yield (str(team_data.get_text(strip=True)), cells)
+
+# same thing, but lxml does the parsing in C and we only ever look at the team cells and the cells after them
+def read_team_rows_lxml(text):
+    root = lxml.html.fromstring(text)
+    for team_data in root.xpath("//td[@align='left' and not(@colspan)]"):
+        cells = []
+        for score_data in team_data.itersiblings(tag=lxml.etree.Element):     # skips the whitespace (and any comments) between cells
+            strings = [bit.strip() for bit in score_data.itertext() if bit.strip()]
+            cells.append(("align" in score_data.attrib, score_data.get("style"), strings))
+        yield ("".join(bit.strip() for bit in team_data.itertext()), cells)
+
+# pick whichever backend we can: lxml if it's asked for and installed, BeautifulSoup otherwise
+def read_team_rows(text, backend=None):
+    if (backend is None):
+        backend = PARSER_BACKEND
+    if (backend == "lxml" and lxml is not None):
+        return(read_team_rows_lxml(text))
+    return(read_team_rows_bs4(text))
+
+# turn the HTML for a season page into the rows we keep in the database:
+# ([(location, season, team, week, rank, score), ...], [(location, season, team, total score), ...])
+def extract_season_rows(location, season, text, backend=None):
     season = str(season)
-    f = open("season" + season + ".html")
-    text = f.read()
     text = text.replace("&copy;", "")	# the copyright symbol breaks some things.  let's not even deal.
-    f.close()
 
-    # let BeautifulSoup deal with parsing the train wreck of the trivia HTML
-    soup = BeautifulSoup(text, "html.parser")
-    
-    c = conn.cursor()
-    all_results = soup.find_all("td", align="left", colspan=None)   # get all the TD containing team names
-    for team_data in all_results:
-        team_name = str(team_data.get_text(strip=True))
+    weekly_rows = []
+    season_rows = []
+    for (team_name, cells) in read_team_rows(text, backend):
         if (VERBOSE): print("team: " + team_name)
         team_name = normalize_team_name(team_name.lower())
         TEAMS[team_name] = 1
         
-        score_data = team_data.next_sibling.next_sibling            # advance to first weekly score
         week = 0
         rank = -1                                                   # weekly placement? (0 = showed up) (-1 = didn't show up) (else = rank)
-        while (score_data is not None):
-            if (score_data.has_attr('align')):                      # final tally score - no color, presented as decimalized number
-                for total_score in score_data.stripped_strings:
+        for (is_total, style, strings) in cells:
+            if (is_total):                                          # final tally score - no color, presented as decimalized number
+                for total_score in strings:
                     total_score = float(total_score)
                     if (VERBOSE): print("TOTAL: " + str(total_score))
-                    c.execute("INSERT INTO season_results VALUES (?,?,?)", (season, team_name, total_score))
-                    conn.commit()
+                    season_rows.append((location, season, team_name, total_score))
                     
             else:                                                   # weekly score: integer, possibly colored
                 week = week + 1
-                style = score_data.get('style')
                 if (style is not None):
                     rank = get_rank(style)                          # see what rank this result maps to, if any
                 else:
                     rank = 0
                  
-                for score in score_data.stripped_strings:
+                for score in strings:
                     score = int(score)
                     if (score == 0):                                # zero scores map to non-attendance (rank -1, to differentiate)
                         rank = -1
-                    (season, team_name, week, rank, score) = override_values(season, team_name, week, rank, score)
+                    (season, team_name, week, rank, score) = override_values(location, season, team_name, week, rank, score)
                     if (VERBOSE): print("WEEK: " + str(week) + "  SCORE: " + str(score) + "  RANK: " + str(rank))
-                    c.execute("INSERT INTO weekly_results VALUES (?,?,?,?,?)", (season, team_name, week, rank, score))
-                    conn.commit()
-
-            score_data = score_data.next_sibling.next_sibling       # advance to next weekly score, if it exists
+                    weekly_rows.append((location, season, team_name, week, rank, score))
         
         if (VERBOSE): print("~~~")
 
-# return a connection to the database
+    return(keep_best_rows(weekly_rows, 4), keep_best_rows(season_rows, 3))
+
+# a team can turn up twice on one page (two spellings that normalize to the same name).
+# the database keeps one result per team per week (and one total per team per season), so keep the better of the two.
+# <key_length> is how many leading columns make up the key; the score is always the last column.
+def keep_best_rows(rows, key_length):
+    best = {}
+    for row in rows:
+        key = row[:key_length]
+        if ((key not in best) or (row[-1] > best[key][-1])):
+            best[key] = row
+    return(list(best.values()))
+
+# read a season's page out of the archive and turn it into database rows (see extract_season_rows).
+# that's the newest version of the page, unless <version> picks an older one (see page_digest).
+# if the page (and everything else that decides what rows come out of it) is the same as last time, the rows come out of PARSE_CACHE instead.
+def read_season_rows(location, season, version=None):
+    digest = page_digest(location, season, version)
+    if (digest is None):
+        raise missing_page(location, season, version)
+    return(read_page_rows(location, season, digest))
+
+# the rows in the archived page whose SHA-256 is <digest>, out of PARSE_CACHE if they're in there.
+# this never looks at the archive's index, so it's what parse workers get handed: their copy of the index
+# is whatever it was when they were forked, and could easily be missing a page (or its newest version) fetched since.
+def read_page_rows(location, season, digest):
+    season = str(season)
+    rows = read_cached_page_rows(location, season, digest)
+    if (rows is not None):
+        return(rows)
+
+    with gzip.open(archive_object(digest), "rt") as fh:
+        text = fh.read()
+    (weekly_rows, season_rows) = extract_season_rows(location, season, text)
+    if (PARSE_CACHE is not None):
+        save_parsed_rows(location, season, parsed_rows_key(location, season, digest), weekly_rows, season_rows)
+    return(weekly_rows, season_rows)
+
+# is the newest version of a season page in the archive, with its rows already in PARSE_CACHE?
+def is_parsed(location, season):
+    digest = page_digest(location, season)
+    if (PARSE_CACHE is None or digest is None):
+        return(False)
+    return(has_parsed_rows(location, str(season), parsed_rows_key(location, str(season), digest)))
+
+# the rows for the page whose SHA-256 is <digest> from PARSE_CACHE, or None if they'd have to be parsed
+def read_cached_page_rows(location, season, digest):
+    if (PARSE_CACHE is None):
+        return(None)
+    season = str(season)
+    return(load_parsed_rows(location, season, parsed_rows_key(location, season, digest)))
+
+# what a season page's parsed rows get filed under: the page's SHA-256, and a hash of the team name fixes and overrides that apply to it
+def parsed_rows_key(location, season, digest):
+    key = hashlib.sha256(digest.encode())
+    key.update(repr((PARSE_CACHE_FORMAT, location, season, sorted(NORMALIZED.items()), OVERRIDES.get(location, {}).get(season))).encode())
+    return(key.digest())
+
+def parsed_rows_file(location, season):
+    return(os.path.join(PARSE_CACHE, "{:s}-season{:s}.rows".format(location, str(season))))
+
+# the cache file for a season holds its key, then the team names on the page (each one once), then the rows a column at a time:
+#   key (32 bytes) | team, weekly row and season row counts (3 x uint32) | each team name (uint16 length + UTF-8)
+#   | weekly rows: team numbers (int32), weeks, ranks, scores (int16 each) | season rows: team numbers (int32), totals (double)
+# (columns are in this machine's byte order: it's a cache, not something to go passing around)
+PARSED_ROWS_HEADER = struct.Struct("<32sIII")
+PARSED_ROWS_NAME = struct.Struct("<H")
+
+def save_parsed_rows(location, season, key, weekly_rows, season_rows):
+    team_ids = {}
+    try:
+        columns = [array.array("i", [team_ids.setdefault(row[2], len(team_ids)) for row in weekly_rows]),
+                   array.array("h", [row[3] for row in weekly_rows]),
+                   array.array("h", [row[4] for row in weekly_rows]),
+                   array.array("h", [row[5] for row in weekly_rows]),
+                   array.array("i", [team_ids.setdefault(row[2], len(team_ids)) for row in season_rows]),
+                   array.array("d", [row[3] for row in season_rows])]
+    except (TypeError, OverflowError):      # something (an override, probably) that doesn't fit.  not worth caching.
+        return
+
+    chunks = [PARSED_ROWS_HEADER.pack(key, len(team_ids), len(weekly_rows), len(season_rows))]
+    for team in team_ids:
+        name = team.encode()
+        chunks.append(PARSED_ROWS_NAME.pack(len(name)) + name)
+    chunks.extend(column.tobytes() for column in columns)
+
+    os.makedirs(PARSE_CACHE, exist_ok=True)
+    path = parsed_rows_file(location, season)
+    with open(path + ".part", "wb") as fh:     # (parse workers each write their own season's file, so this is all the care it needs)
+        fh.write(b"".join(chunks))
+    os.replace(path + ".part", path)
+
+# are there rows saved for a season under <key>?  (just a peek at the start of the file: see load_parsed_rows for the rows)
+def has_parsed_rows(location, season, key):
+    try:
+        with open(parsed_rows_file(location, season), "rb") as fh:
+            return(fh.read(len(key)) == key)
+    except FileNotFoundError:
+        return(False)
+
+# the rows saved for a season (see save_parsed_rows), or None if there aren't any saved under <key>
+def load_parsed_rows(location, season, key):
+    try:
+        with open(parsed_rows_file(location, season), "rb") as fh:
+            data = fh.read()
+    except FileNotFoundError:
+        return(None)
+
+    try:
+        (saved_key, team_count, weekly_count, season_count) = PARSED_ROWS_HEADER.unpack_from(data)
+        if (saved_key != key):
+            return(None)
+        offset = PARSED_ROWS_HEADER.size
+        teams = []
+        for n in range(team_count):
+            (length,) = PARSED_ROWS_NAME.unpack_from(data, offset)
+            offset += PARSED_ROWS_NAME.size
+            teams.append(data[offset:offset + length].decode())
+            offset += length
+        columns = []
+        for (typecode, count) in (("i", weekly_count), ("h", weekly_count), ("h", weekly_count), ("h", weekly_count), ("i", season_count), ("d", season_count)):
+            column = array.array(typecode)
+            column.frombytes(data[offset:offset + count * column.itemsize])
+            offset += count * column.itemsize
+            columns.append(column)
+    except (struct.error, ValueError, UnicodeDecodeError):     # half a file, or not one of ours.  parse the page instead.
+        return(None)
+
+    (weekly_teams, weeks, ranks, scores, season_teams, totals) = columns
+    if (len(scores) != weekly_count or len(totals) != season_count):
+        return(None)
+    weekly_rows = [(location, season, teams[team], week, rank, score) for (team, week, rank, score) in zip(weekly_teams, weeks, ranks, scores)]
+    season_rows = [(location, season, teams[team], total) for (team, total) in zip(season_teams, totals)]
+    return(weekly_rows, season_rows)
+
+# for a given season at a given location, look through its page of HTML and store the bits we care about in a database
+# every row for the season gets gathered up first and written in one transaction: all of the season lands, or none of it does
+# (that includes any purge_season() that's still waiting to be committed)
+# <version> picks an older version of the page to go back to (see read_season_rows)
+def parse_season(db, location, season, version=None):
+    conn = db.conn
+    with conn:              # commits when we're done, rolls back if anything below blows up
+        (weekly_rows, season_rows) = read_season_rows(location, season, version)
+        c = conn.cursor()
+        c.executemany("INSERT INTO weekly_results VALUES (?,?,?,?,?,?)", weekly_rows)
+        c.executemany("INSERT INTO season_results VALUES (?,?,?,?)", season_rows)
+    mark_dirty(db, location, season, 0)
+
+# parse_season for a whole list of (location, season) pairs, with the parsing spread over <workers> processes.
+# the pages don't depend on each other, so each worker just hands back plain row tuples,
+# and this process is the only one that ever writes to the database (all in one transaction).
+# pages that are already in PARSE_CACHE don't need a worker: their rows get read in right here.
+def parse_seasons(db, location_seasons, workers=None):
+    if (workers is None):
+        workers = PARSE_WORKERS
+    conn = db.conn
+    digests = []
+    for (location, season) in location_seasons:
+        digests.append(page_digest(location, season))
+        if (digests[-1] is None):
+            raise missing_page(location, season)
+    cached_rows = [read_cached_page_rows(location, season, digest) for ((location, season), digest) in zip(location_seasons, digests)]
+    unparsed = [location_season + (digest,) for (location_season, digest, rows) in zip(location_seasons, digests, cached_rows) if rows is None]
+    workers = max(1, min(workers, len(unparsed)))
+    locations = [location for (location, season, digest) in unparsed]
+    seasons = [season for (location, season, digest) in unparsed]
+    digests = [digest for (location, season, digest) in unparsed]
+
+    # workers get told exactly which version of each page to read (see read_page_rows)
+    with conn:
+        c = conn.cursor()
+        if (workers == 1):
+            all_rows = map(read_page_rows, locations, seasons, digests)
+        else:
+            pool = parse_process_pool(workers)
+            all_rows = pool.map(read_page_rows, locations, seasons, digests)
+        try:
+            for rows in cached_rows:        # parsed pages come back in the same order the seasons went in: fill them in where the cache came up empty
+                (weekly_rows, season_rows) = rows if rows is not None else next(all_rows)
+                c.executemany("INSERT INTO weekly_results VALUES (?,?,?,?,?,?)", weekly_rows)
+                c.executemany("INSERT INTO season_results VALUES (?,?,?,?)", season_rows)
+        finally:
+            if (workers > 1):
+                pool.shutdown()
+    for (location, season) in location_seasons:
+        mark_dirty(db, location, season, 0)
+
+# a pool of <workers> processes to parse pages with.
+# forked workers start out as copies of us, which is quickest.  no fork (hi, Windows)?  freshly spawned workers just import this module.
+def parse_process_pool(workers):
+    if ("fork" in multiprocessing.get_all_start_methods()):
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    return(concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context))
+
+# fetch_seasons and parse_seasons at the same time, for a rebuild: pages get parsed as soon as they've downloaded,
+# and their rows get written (STREAM_BATCH seasons to a transaction) as soon as they've been parsed, so the whole thing takes
+# about as long as the slowest of the three, instead of all of them added up.  every page in <location_seasons> gets ingested.
+#   fetch: <fetch_workers> threads downloading pages (see get_season)
+#   parse: <parse_workers> threads, each handing pages to the process pool to parse (or reading them out of PARSE_CACHE)
+#   write: this thread, the only one that ever writes to the database
+# between each step and the next is a queue with room for STREAM_QUEUE pages: once it's full, the step before waits.
+# returns how each step went: {"fetch": {...}, "parse": {...}, "write": {...}} (see StageMetrics.record),
+# with how many of the pages were new or changed (see get_season) as the fetch step's "changed"
+def stream_seasons(db, location_seasons, overwrite=False, fetch_workers=None, parse_workers=None):
+    if (fetch_workers is None):
+        fetch_workers = FETCH_WORKERS
+    if (parse_workers is None):
+        parse_workers = PARSE_WORKERS
+    if (page_cache is None):
+        load_page_cache()
+    conn = db.conn
+    fetch_workers = max(1, min(fetch_workers, len(location_seasons)))
+    parse_workers = max(1, min(parse_workers, len(location_seasons)))
+    metrics = dict((name, StageMetrics(name)) for name in ("fetch", "parse", "write"))
+    pages = queue.Queue(STREAM_QUEUE)       # (location, season) of each page that's been downloaded
+    parsed = queue.Queue(STREAM_QUEUE)      # ((location, season), (weekly rows, season rows)) of each page that's been parsed
+    stop = threading.Event()                # set when any step falls over, so the rest give up instead of waiting on it forever
+    errors = []
+    changed = []                            # (location, season) of each page that was new or changed
+
+    # get the workers going before there are any threads around to confuse fork().  but if every page is already in
+    # the archive with its rows in PARSE_CACHE (a rebuild from pages that haven't changed), there's nothing to parse,
+    # so don't start any: a page that turns out to have changed after all just gets parsed right here.
+    pool = None
+    if (not all(is_parsed(location, season) for (location, season) in location_seasons)):
+        pool = parse_process_pool(parse_workers)
+        pool.submit(int).result()
+
+    def fetch(location, season):
+        start = time.perf_counter()
+        if (get_season(location, season, overwrite)):
+            changed.append((location, season))
+        metrics["fetch"].add(items=1, busy=time.perf_counter() - start)
+        metrics["fetch"].put(pages, (location, season), stop)
+
+    def fetcher():
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool:
+                for future in [fetch_pool.submit(fetch, location, season) for (location, season) in location_seasons]:
+                    future.result()     # re-raise any download that failed for good
+        finally:
+            for n in range(parse_workers):      # one "that's all" for each parser
+                metrics["fetch"].put(pages, None, stop)
+
+    def parser():
+        try:
+            while True:
+                location_season = metrics["parse"].get(pages, stop)
+                if (location_season is None):
+                    break
+                start = time.perf_counter()
+                (location, season) = location_season
+                digest = page_digest(location, season)      # (the worker's copy of the archive index is older than this page: see read_page_rows)
+                if (digest is None):
+                    raise missing_page(location, season)
+                rows = read_cached_page_rows(location, season, digest)
+                if (rows is None and pool is None):
+                    rows = read_page_rows(location, season, digest)
+                elif (rows is None):
+                    rows = pool.submit(read_page_rows, location, season, digest).result()
+                metrics["parse"].add(items=1, busy=time.perf_counter() - start)
+                metrics["parse"].put(parsed, (location_season, rows), stop)
+        finally:
+            metrics["parse"].put(parsed, None, stop)
+
+    def step(body):
+        try:
+            body()
+        except StreamStopped:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def write(batch):
+        start = time.perf_counter()
+        with conn:
+            c = conn.cursor()
+            for (location_season, (weekly_rows, season_rows)) in batch:
+                c.executemany("INSERT INTO weekly_results VALUES (?,?,?,?,?,?)", weekly_rows)
+                c.executemany("INSERT INTO season_results VALUES (?,?,?,?)", season_rows)
+        for ((location, season), rows) in batch:
+            mark_dirty(db, location, season, 0)
+        metrics["write"].add(items=len(batch), busy=time.perf_counter() - start)
+
+    threads = [threading.Thread(target=step, args=(fetcher,))] + [threading.Thread(target=step, args=(parser,)) for n in range(parse_workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        (batch, parsers_left) = ([], parse_workers)
+        while (parsers_left > 0):
+            item = metrics["write"].get(parsed, stop)
+            if (item is None):
+                parsers_left -= 1
+                continue
+            batch.append(item)
+            if (len(batch) >= STREAM_BATCH):
+                write(batch)
+                batch = []
+        write(batch)
+    except StreamStopped:
+        pass
+    finally:
+        stop.set()          # (everybody's done by now, unless something went wrong)
+        for thread in threads:
+            thread.join()
+        if (pool is not None):
+            pool.shutdown()
+    if (errors):
+        raise errors[0]
+
+    seconds = time.perf_counter() - start
+    records = dict((name, stage.record(seconds)) for (name, stage) in metrics.items())
+    records["fetch"]["changed"] = len(changed)
+    return(records)
+
+# one step of stream_seasons gave up because another one fell over
+class StreamStopped(Exception):
+    pass
+
+# how one step of stream_seasons went: how many pages it got through, how long it spent working on them,
+# and how long it sat waiting, either on the step before it (starved) or for room in the queue to the step after it (backpressure).
+# (with more than one thread in a step, those are all of its threads' seconds added up)
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.backpressure = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, items=0, busy=0.0, starved=0.0, backpressure=0.0):
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.starved += starved
+            self.backpressure += backpressure
+
+    # the next thing off <q>, counting the wait as starved (and giving up if <stop> gets set meanwhile)
+    def get(self, q, stop):
+        start = time.perf_counter()
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if (stop.is_set()):
+                    raise StreamStopped()
+        self.add(starved=time.perf_counter() - start)
+        return(item)
+
+    # put <item> on <q>, counting any wait for room as backpressure (and giving up if <stop> gets set meanwhile)
+    def put(self, q, item, stop):
+        start = time.perf_counter()
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if (stop.is_set()):
+                    raise StreamStopped()
+        self.add(backpressure=time.perf_counter() - start)
+
+    # ready for json.dumps.  <seconds> is how long the whole stream took.
+    def record(self, seconds):
+        return({"items": self.items, "per_second": round(self.items / seconds, 3) if seconds > 0 else 0.0,
+                "busy": round(self.busy, 6), "starved": round(self.starved, 6), "backpressure": round(self.backpressure, 6)})
+
+# everything that goes with one database: its connection (made the first time something actually needs it),
+# the lock that threads sharing that connection take turns with, and the seasons whose results changed since the summaries were refreshed.
+# reports can also be read on read-only connections of their own (see reading), which don't have to wait on anybody.
+class Database:
+    def __init__(self, path=None, reset=False, shared=False, profile=False):
+        self.path = path if path is not None else DATABASE
+        self.reset = reset          # burn it down and start over when connecting
+        self.shared = shared        # used from more than one thread (take self.lock first)
+        self.profile = profile      # count and time every query (see TimedConnection)
+        self.lock = threading.Lock()
+        self.dirty_seasons = {}     # (location, season) -> earliest week that changed, or None if only the season totals did
+        self._conn = None
+        self.readers = queue.Queue()        # read-only connections nobody's using right now
+        self.all_readers = []
+        self.local = threading.local()      # .reader: the read-only connection this thread is using, if any
+
+    @property
+    def conn(self):
+        reader = getattr(self.local, "reader", None)
+        if (reader is not None):
+            return(reader)
+        if (self._conn is None):
+            self._conn = connect_database(self.path, self.reset, self.shared, self.profile)
+        return(self._conn)
+
+    # can reports be read on connections of their own?  (not with an in-memory database: nobody else can see it)
+    @property
+    def concurrent_reads(self):
+        return(REPORT_WORKERS > 1 and self.path != ":memory:")
+
+    # run whatever's in the with block on a read-only connection of this thread's own (borrowed from the pool, or made if they're all busy),
+    # so it doesn't have to wait for anybody else reading (or, with a write-ahead log, writing) the database.
+    # without concurrent_reads, this takes turns on the one connection instead.
+    @contextlib.contextmanager
+    def reading(self):
+        if (getattr(self.local, "reader", None) is not None):      # already reading
+            yield
+            return
+        if (not self.concurrent_reads):
+            with self.lock:
+                yield
+            return
+
+        try:
+            reader = self.readers.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                self.conn       # (make sure the database is there, and up to date, first)
+                reader = connect_reader(self.path, self.profile)
+                self.all_readers.append(reader)
+        self.local.reader = reader
+        try:
+            yield
+        finally:
+            self.local.reader = None
+            self.readers.put(reader)
+
+    # function name -> [queries run, seconds spent running them and reading their rows] (only kept track of when profiling)
+    def query_stats(self):
+        if (self._conn is None or not self.profile):
+            return({})
+        stats = dict((owner, list(counts)) for (owner, counts) in self._conn.query_stats.items())
+        for reader in self.all_readers:
+            for (owner, (queries, seconds)) in reader.query_stats.items():
+                counts = stats.setdefault(owner, [0, 0.0])
+                counts[0] += queries
+                counts[1] += seconds
+        return(stats)
+
+    def close(self):
+        for reader in self.all_readers:
+            reader.close()
+        self.all_readers = []
+        self.readers = queue.Queue()
+        if (self._conn is not None):
+            self._conn.close()
+            self._conn = None
+
+# a connection that keeps count of the queries it runs, and how long they (and reading their rows) take, by which function asked
+class TimedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_stats = {}
+
+    def cursor(self, factory=None):
+        return(super().cursor(factory or TimedCursor))
+
+    def execute(self, sql, parameters=()):
+        return(self.cursor().timed(sqlite3.Cursor.execute, sql, parameters, sys._getframe(1).f_code.co_name))
+
+    def executemany(self, sql, parameters):
+        return(self.cursor().timed(sqlite3.Cursor.executemany, sql, parameters, sys._getframe(1).f_code.co_name))
+
+    def add_query_time(self, owner, seconds, queries=0):
+        stats = self.query_stats.setdefault(owner, [0, 0.0])
+        stats[0] += queries
+        stats[1] += seconds
+
+class TimedCursor(sqlite3.Cursor):
+    owner = None    # the function that ran the query this cursor's reading rows from
+
+    def timed(self, method, sql, parameters, owner):
+        self.owner = owner
+        start = time.perf_counter()
+        try:
+            return(method(self, sql, parameters))
+        finally:
+            self.connection.add_query_time(owner, time.perf_counter() - start, 1)
+
+    def execute(self, sql, parameters=()):
+        return(self.timed(sqlite3.Cursor.execute, sql, parameters, sys._getframe(1).f_code.co_name))
+
+    def executemany(self, sql, parameters):
+        return(self.timed(sqlite3.Cursor.executemany, sql, parameters, sys._getframe(1).f_code.co_name))
+
+    # rows get read (and mostly, the query gets run) as they're asked for, so that counts too
+    def read_timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return(method(self, *args))
+        finally:
+            self.connection.add_query_time(self.owner, time.perf_counter() - start)
+
+    def __next__(self):
+        return(self.read_timed(sqlite3.Cursor.__next__))
+
+    def fetchone(self):
+        return(self.read_timed(sqlite3.Cursor.fetchone))
+
+    def fetchall(self):
+        return(self.read_timed(sqlite3.Cursor.fetchall))
+
+# return a connection to the database at <path>
 # (deleting the database and recreating its core tables, if so desired)
-def connect_database():
-    if (RESET_DATABASE):
-        if (os.path.exists(DATABASE)):
-            os.remove(DATABASE)
+# <shared> connections can be used from more than one thread, and <profile>d ones keep track of every query (see TimedConnection)
+def connect_database(path=None, reset=False, shared=False, profile=False):
+    if (path is None):
+        path = DATABASE
+    if (reset):
+        for leftover in (path, path + "-wal", path + "-shm"):   # don't let an old write-ahead log haunt the new database
+            if (os.path.exists(leftover)):
+                os.remove(leftover)
 
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(path, check_same_thread=not shared, factory=TimedConnection if profile else sqlite3.Connection)
+    if (REPORT_WORKERS > 1 and path != ":memory:"):
+        conn.execute("PRAGMA journal_mode=WAL")     # so report readers (see connect_reader) and whoever's writing don't hold each other up
     
-    if (RESET_DATABASE):        # burn the world, recreate empty tables to be re-filled
+    if (reset):        # burn the world, recreate empty tables to be re-filled
+        if (FAST_REBUILD):
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
         c = conn.cursor()
         c.execute("CREATE TABLE weekly_results (season INTEGER, team TEXT, week INTEGER, rank INTEGER, score REAL)")
         c.execute("CREATE TABLE season_results (season INTEGER, team TEXT, score REAL)")
         conn.commit()
-    elif (PURGE_LAST_SEASON):
-        c = conn.cursor()
-        c.execute("DELETE FROM weekly_results WHERE season=?", [LAST_SEASON])
-        c.execute("DELETE FROM season_results WHERE season=?", [LAST_SEASON])
+
+    migrate_database(conn)      # brand new or years old, bring the tables up to the current layout
     
     return(conn)
+
+# a read-only connection to the (already existing, already migrated) database at <path>, for reading reports on.
+# any thread can use it, one at a time (see Database.reading).
+def connect_reader(path=None, profile=False):
+    if (path is None):
+        path = DATABASE
+    return(sqlite3.connect("file:{:s}?mode=ro".format(urllib.parse.quote(os.path.abspath(path))), uri=True, check_same_thread=False,
+                           factory=TimedConnection if profile else sqlite3.Connection))
+
+# run every migration the database hasn't had yet, each in its own transaction.
+# PRAGMA user_version keeps track of how many migrations a database has been through.
+def migrate_database(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for (number, migration) in enumerate(MIGRATIONS[version:], version + 1):
+        if (VERBOSE): print("migrating to schema version {:d} ({:s})".format(number, migration.__name__))
+        with conn:
+            migration(conn)
+            conn.execute("PRAGMA user_version={:d}".format(number))
+
+# schema version 1: rebuild the results tables with primary keys, so a team can only have one result per week / total per season.
+# any duplicates (see keep_best_rows) get boiled down to the best row on the way across.
+def add_result_keys(conn):
+    key_columns = [row[1] for row in conn.execute("PRAGMA table_info(weekly_results)") if row[5] > 0]
+    if (key_columns):       # made by a version of this script that already had the keys, just not the version number
+        return
+
+    c = conn.cursor()
+    c.execute("ALTER TABLE weekly_results RENAME TO old_weekly_results")
+    c.execute("ALTER TABLE season_results RENAME TO old_season_results")
+    c.execute("CREATE TABLE weekly_results (season INTEGER, team TEXT, week INTEGER, rank INTEGER, score REAL, PRIMARY KEY (season, team, week))")
+    c.execute("CREATE TABLE season_results (season INTEGER, team TEXT, score REAL, PRIMARY KEY (season, team))")
+    c.execute("""INSERT INTO weekly_results SELECT season, team, week, rank, score FROM
+                 (SELECT *, ROW_NUMBER() OVER (PARTITION BY season, team, week ORDER BY score DESC, rowid) AS n FROM old_weekly_results) WHERE n=1""")
+    c.execute("""INSERT INTO season_results SELECT season, team, score FROM
+                 (SELECT *, ROW_NUMBER() OVER (PARTITION BY season, team ORDER BY score DESC, rowid) AS n FROM old_season_results) WHERE n=1""")
+    c.execute("DROP TABLE old_weekly_results")
+    c.execute("DROP TABLE old_season_results")
+
+# schema version 2: indexes for the ways the reports actually look at the data, so they stop scanning whole tables
+def add_result_indexes(conn):
+    c = conn.cursor()
+    # "best/worst scores in a week", "who showed up that week": everything those need is in the index itself
+    c.execute("CREATE INDEX weekly_results_by_week ON weekly_results (season, week, score DESC, team, rank)")
+    # anything about one team
+    c.execute("CREATE INDEX weekly_results_by_team ON weekly_results (team, season, week)")
+    # first place finishes, lowest winning scores
+    c.execute("CREATE INDEX weekly_results_by_rank ON weekly_results (rank, score)")
+    # top seasons, season winners and runners up
+    c.execute("CREATE INDEX season_results_by_season ON season_results (season, score DESC, team)")
+    c.execute("CREATE INDEX season_results_by_score ON season_results (score DESC, season DESC)")
+    c.execute("ANALYZE")
+
+# schema version 3: summary tables that the reports read from, instead of re-adding up every result ever on every run.
+# refresh_summaries keeps them up to date, only redoing the seasons (and weeks) that changed.
+def add_summary_tables(conn):
+    c = conn.cursor()
+    # per team per season, and all-time per team: how many weeks, points, times present and first place finishes
+    c.execute("CREATE TABLE team_season_totals (season INTEGER, team TEXT, weeks INTEGER, points REAL, showings INTEGER, firsts INTEGER, PRIMARY KEY (season, team))")
+    c.execute("CREATE TABLE team_totals (team TEXT PRIMARY KEY, weeks INTEGER, points REAL, showings INTEGER, firsts INTEGER)")
+    # who won each season (share is the fraction of the win, if teams tied)
+    c.execute("CREATE TABLE season_winners (season INTEGER, team TEXT, share REAL, PRIMARY KEY (season, team))")
+    # streaks still going (started is when, in streak bookkeeping order), and every streak that's ended
+    c.execute("CREATE TABLE streak_state (team TEXT PRIMARY KEY, weeks INTEGER, started INTEGER)")
+    c.execute("CREATE TABLE streak_history (recorded INTEGER PRIMARY KEY, team TEXT, weeks INTEGER, season INTEGER, week INTEGER)")
+    c.execute("CREATE INDEX streak_history_by_length ON streak_history (weeks DESC, recorded DESC)")
+    # bookkeeping: how far the streaks have gotten, the next bookkeeping number, and whether everything needs redoing
+    c.execute("CREATE TABLE summary_state (name TEXT PRIMARY KEY, value)")
+    c.execute("INSERT INTO summary_state VALUES ('stale', 1)")
+
+# schema version 4: every result (and everything summed up from them) belongs to a location, so one database can hold many pubs.
+# whatever was in here already came from DEFAULT_LOCATION.  the summary tables just get rebuilt from scratch.
+def add_locations(conn):
+    c = conn.cursor()
+    c.execute("ALTER TABLE weekly_results RENAME TO old_weekly_results")
+    c.execute("ALTER TABLE season_results RENAME TO old_season_results")
+    c.execute("CREATE TABLE weekly_results (location TEXT, season INTEGER, team TEXT, week INTEGER, rank INTEGER, score REAL, PRIMARY KEY (location, season, team, week))")
+    c.execute("CREATE TABLE season_results (location TEXT, season INTEGER, team TEXT, score REAL, PRIMARY KEY (location, season, team))")
+    c.execute("INSERT INTO weekly_results SELECT ?, season, team, week, rank, score FROM old_weekly_results", [DEFAULT_LOCATION])
+    c.execute("INSERT INTO season_results SELECT ?, season, team, score FROM old_season_results", [DEFAULT_LOCATION])
+    c.execute("DROP TABLE old_weekly_results")      # (their indexes go with them)
+    c.execute("DROP TABLE old_season_results")
+
+    # the same indexes as version 2, with the location up front: the reports only ever look at one location at a time
+    c.execute("CREATE INDEX weekly_results_by_week ON weekly_results (location, season, week, score DESC, team, rank)")
+    c.execute("CREATE INDEX weekly_results_by_team ON weekly_results (location, team, season, week)")
+    c.execute("CREATE INDEX weekly_results_by_rank ON weekly_results (location, rank, score)")
+    c.execute("CREATE INDEX season_results_by_season ON season_results (location, season, score DESC, team)")
+    c.execute("CREATE INDEX season_results_by_score ON season_results (location, score DESC, season DESC)")
+
+    # the same summary tables as version 3, kept per location
+    for table in ("team_season_totals", "team_totals", "season_winners", "streak_state", "streak_history", "summary_state"):
+        c.execute("DROP TABLE " + table)
+    c.execute("CREATE TABLE team_season_totals (location TEXT, season INTEGER, team TEXT, weeks INTEGER, points REAL, showings INTEGER, firsts INTEGER, PRIMARY KEY (location, season, team))")
+    c.execute("CREATE TABLE team_totals (location TEXT, team TEXT, weeks INTEGER, points REAL, showings INTEGER, firsts INTEGER, PRIMARY KEY (location, team))")
+    c.execute("CREATE TABLE season_winners (location TEXT, season INTEGER, team TEXT, share REAL, PRIMARY KEY (location, season, team))")
+    c.execute("CREATE TABLE streak_state (location TEXT, team TEXT, weeks INTEGER, started INTEGER, PRIMARY KEY (location, team))")
+    c.execute("CREATE TABLE streak_history (location TEXT, recorded INTEGER, team TEXT, weeks INTEGER, season INTEGER, week INTEGER, PRIMARY KEY (location, recorded))")
+    c.execute("CREATE INDEX streak_history_by_length ON streak_history (location, weeks DESC, recorded DESC)")
+    c.execute("CREATE TABLE summary_state (location TEXT, name TEXT, value, PRIMARY KEY (location, name))")
+    c.execute("INSERT INTO summary_state VALUES ('', 'stale', 1)")    # (not any one location's business)
+    c.execute("ANALYZE")
+
+# every change ever made to the database layout, oldest first.  a database's user_version says how many it's had.
+# never change or reorder one of these once it's out there: add a new one to the end instead.
+MIGRATIONS = [
+    add_result_keys,
+    add_result_indexes,
+    add_summary_tables,
+    add_locations,
+]
+
+# the same rule clean_database applies: a week where nobody scored anything never really happened (or hasn't happened yet),
+# and a season with a week like that isn't over, so it doesn't get season totals.
+def drop_unreal_weeks(weekly_rows, season_rows):
+    best_scores = {}
+    for (location, season, team, week, rank, score) in weekly_rows:
+        best_scores[week] = max(score, best_scores.get(week, score))
+    unreal_weeks = set(week for (week, score) in best_scores.items() if score <= 0)
+    if (not unreal_weeks):
+        return(weekly_rows, season_rows)
+    return([row for row in weekly_rows if row[3] not in unreal_weeks], [])
+
+# bring the database up to date with a season's page by only touching what's actually different:
+# new or changed rows get upserted, rows that aren't on the page any more get deleted, everything else is left alone.
+# on a normal week that's one week's worth of rows.  returns how many rows were touched.
+# <version> picks an older version of the page to go back to (see read_season_rows)
+def sync_season(db, location, season, version=None):
+    conn = db.conn
+    (weekly_rows, season_rows) = drop_unreal_weeks(*read_season_rows(location, season, version))
+    season = int(season)
+
+    with conn:
+        c = conn.cursor()
+        stored_weeks = {}
+        for (team, week, rank, score) in c.execute("SELECT team, week, rank, score FROM weekly_results WHERE location=? AND season=?", [location, season]):
+            stored_weeks[(team, week)] = (rank, score)
+        stored_totals = {}
+        for (team, score) in c.execute("SELECT team, score FROM season_results WHERE location=? AND season=?", [location, season]):
+            stored_totals[team] = score
+
+        changed_weeks = [row for row in weekly_rows if stored_weeks.get((row[2], row[3])) != (row[4], row[5])]
+        changed_totals = [row for row in season_rows if stored_totals.get(row[2]) != row[3]]
+        parsed_weeks = set((row[2], row[3]) for row in weekly_rows)
+        parsed_totals = set(row[2] for row in season_rows)
+        gone_weeks = [(location, season, team, week) for (team, week) in stored_weeks if (team, week) not in parsed_weeks]
+        gone_totals = [(location, season, team) for team in stored_totals if team not in parsed_totals]
+
+        c.executemany("INSERT INTO weekly_results VALUES (?,?,?,?,?,?) ON CONFLICT (location, season, team, week) DO UPDATE SET rank=excluded.rank, score=excluded.score", changed_weeks)
+        c.executemany("INSERT INTO season_results VALUES (?,?,?,?) ON CONFLICT (location, season, team) DO UPDATE SET score=excluded.score", changed_totals)
+        c.executemany("DELETE FROM weekly_results WHERE location=? AND season=? AND team=? AND week=?", gone_weeks)
+        c.executemany("DELETE FROM season_results WHERE location=? AND season=? AND team=?", gone_totals)
+
+    touched_weeks = [row[3] for row in changed_weeks + gone_weeks]
+    if (touched_weeks):
+        mark_dirty(db, location, season, min(touched_weeks))
+    elif (changed_totals or gone_totals):
+        mark_dirty(db, location, season, None)
+
+    touched = len(changed_weeks) + len(changed_totals) + len(gone_weeks) + len(gone_totals)
+    print("{:s} season {:d}: {:d} rows touched ({:d} weekly and {:d} season rows written, {:d} removed)".format(
+        location, season, touched, len(changed_weeks), len(changed_totals), len(gone_weeks) + len(gone_totals)))
+    return(touched)
+
+# burn everything we know about a location's season, so its (changed) page can be re-parsed from scratch
+def purge_season(db, location, season):
+    conn = db.conn
+    c = conn.cursor()
+    c.execute("DELETE FROM weekly_results WHERE location=? AND season=?", [location, season])
+    c.execute("DELETE FROM season_results WHERE location=? AND season=?", [location, season])
+    mark_dirty(db, location, season, 0)
  
+# how a value shows up in a table cell.  team names come up over and over, so each one only gets prettied up
+# (and escaped: they're whatever the website says they are, < and & included) once.
+def cell_text(element):
+    if (type(element) is not str):
+        return(str(element).title())
+    text = cell_texts.get(element)
+    if (text is None):
+        text = html.escape(element.title().replace("'S", "'s"), quote=False)
+        cell_texts[element] = text
+    return(text)
+
+# the HTML for a whole table row (<columns> cells, highlighted or not), with a {} for each cell's text.
+# put together the first time it's needed, then reused for every row that looks the same.
+def row_template(columns, btag, otag, ctag):
+    key = (columns, btag, otag, ctag)
+    template = row_templates.get(key)
+    if (template is None):
+        cell = '<TD ALIGN="CENTER"' + btag + '>' + otag + '{}' + ctag + '</FONT></TD>\n'
+        template = '<TR>\n' + cell * columns + '</TR>\n'
+        row_templates[key] = template
+    return(template)
+
 # takes a title for the table, an array of column headers, and an array of tuples with table data
 # the number of column headers and the number of non-bool elements per tuple should match
-# prints to the writefile that data in pretty HTML form
-def print_table(title, header_arr, data):
-    global writefile
-
-    # top of the table and table title row
-    writefile.write('<TABLE BORDER=1 CELLPADDING=3 CELLSPACING=4 BGCOLOR="eeeeee">\n')
-    writefile.write('<TR>\n<TH BGCOLOR="{:s}" ALIGN="CENTER" COLSPAN={:d}><FONT COLOR="{:s}">{:s}</FONT></TH>\n</TR>\n'.format(TITLE_BGCOLOR, len(header_arr), TITLE_TEXTCOLOR, title))
-    
-    # print out all the column headers
-    writefile.write('<TR>\n')
+# yields that data in pretty HTML form, a chunk (of up to REPORT_CHUNK_ROWS rows) at a time, with <team>'s rows highlighted
+def render_table(title, header_arr, data, team=None):
+    if (team is None):
+        team = SELECTED_TEAM
+    # top of the table, title row, and all the column headers
+    chunk = [TABLE_START.format(len(header_arr), title), '<TR>\n']
     for header in header_arr:
-        writefile.write('<TH>{:s}</TH>\n'.format(header))
-    writefile.write('</TR>\n')
-    
+        chunk.append('<TH>{:s}</TH>\n'.format(header))
+    chunk.append('</TR>\n')
+
+    check_winner = (len(header_arr) > 2 and header_arr[2] == 'Winner')
     for row in data:
-        writefile.write('<TR>\n')
         btag = ""
         otag = ""
         ctag = ""
-        if ((SELECTED_TEAM in row) or (SELECTED_TEAM in str(row[1])) or ((len(row)>2) and (SELECTED_TEAM in str(row[2])) and (header_arr[2]=='Winner'))):    # our team is special! highlight those rows.
+        if ((team in row) or (team in str(row[1])) or (check_winner and (len(row)>2) and (team in str(row[2])))):    # our team is special! highlight those rows.
             btag = ' BGCOLOR="ffff00"'
             otag = '<FONT COLOR=0000ff><b>'
             ctag = '</b></FONT>'
-        if (type(row[-1]) is bool and row[-1]):                     # streak data contains an "is current?" bool as its last item.  format special if true
-            otag = '<FONT COLOR=ff0000><b>'
-            ctag = '</b></FONT>'
-        for element in row:
-            if type(element) is not bool:                           # don't print out ugly "is current?" in text form
-                writefile.write('<TD ALIGN="CENTER"{:s}>{:s}{:s}{:s}</FONT></TD>\n'.format(btag, otag, str(element).title().replace("'S", "'s"), ctag))
-        writefile.write('</TR>\n')
-    writefile.write('</TABLE>\n')
-
-# return a list of all the seasons where we have honest-to-gosh results
-def get_seasons():
+        if (type(row[-1]) is bool):                                 # streak data contains an "is current?" bool as its last item.  format special if true
+            if (row[-1]):
+                otag = '<FONT COLOR=ff0000><b>'
+                ctag = '</b></FONT>'
+            row = row[:-1]                                          # don't print out ugly "is current?" in text form
+        chunk.append(row_template(len(row), btag, otag, ctag).format(*[cell_text(element) for element in row]))
+        if (len(chunk) >= REPORT_CHUNK_ROWS):
+            yield("".join(chunk))
+            chunk = []
+    chunk.append('</TABLE>\n')
+    yield("".join(chunk))
+
+# return a list of all the seasons where we have honest-to-gosh results at <location>
+def get_seasons(db, location):
+    conn = db.conn
     c = conn.cursor()
     
     seasons = []
-    season_rows = c.execute("SELECT DISTINCT season FROM season_results ORDER BY season ASC")
+    season_rows = c.execute("SELECT DISTINCT season FROM season_results WHERE location=? ORDER BY season ASC", [location])
     for row in season_rows:
         seasons.append(row[0])
     return(seasons)
 
-# get all the seasons and weeks that actually existed with scores, ordered from first to last
+# get all the seasons and weeks that actually existed with scores at <location>, ordered from first to last
 # return that data as a list of (season, week) tuples
-def get_season_weeks():
+def get_season_weeks(db, location):
+    conn = db.conn
     c = conn.cursor()
     
     season_weeks = []
-    season_weeks_rows = c.execute("SELECT DISTINCT season, week FROM weekly_results ORDER BY season ASC, week ASC")
+    season_weeks_rows = c.execute("SELECT DISTINCT season, week FROM weekly_results WHERE location=? ORDER BY season ASC, week ASC", [location])
     for row in season_weeks_rows:
         season_weeks.append(row)
 
@@ -269,153 +1344,284 @@ def get_season_weeks():
 # sometimes, we'll have data from weeks that never "really" existed.
 # or "weeks" that are from the current ongoing season that are still in the future, so they haven't happened yet.
 # we should get rid of those.
-def clean_database():
-    global last_week_tuple
+# returns what got purged: ([(location, season, week), ...] that weren't real, [(location, season)s that got their totals thrown out])
+def clean_database(db):
+    conn = db.conn
+    # a week whose top score was 0 wasn't real.
+    # any season with an "unreal" week probably isn't legit in its own right either (or isn't over yet), so its totals go too.
+    unreal_weeks_query = "SELECT location, season, week FROM weekly_results GROUP BY location, season, week HAVING MAX(score) <= 0"
 
-    season_weeks = get_season_weeks()
-    last_week_tuple = (season_weeks[-1:])[0]    # save the last season/week for display on the HTML page
-    c = conn.cursor()
-    
-    weeks_to_unexist = []
-    seasons_to_unexist = {}
-    for season_week in season_weeks:
-        (season, week) = season_week
-        max_score_rows = c.execute("SELECT MAX(score) FROM weekly_results WHERE season={:d} AND week={:d}".format(season, week))
-        max_score_tuple = max_score_rows.fetchone()
-        max_score = max_score_tuple[0]
-        #if (VERBOSE): print(season, week, max_score)
-        if (max_score <= 0):         # top score for the week was 0?  yeah, that week wasn't real.
-            if (VERBOSE): print("S{:d} W{:d} was not 'real' - tagging for deletion.".format(season, week))
-            weeks_to_unexist.append(season_week)
-            seasons_to_unexist[season] = True   # any season with an "unreal" week probably isn't legit in its own right.  purge it.
-    
-    # delete every week where the week's data was garbage
-    for non_week in weeks_to_unexist:
-        c.execute("DELETE FROM weekly_results WHERE season=? AND week=?", non_week)
-        conn.commit()
-    
-    # delete every season that had a garbage week going on at some point
-    for non_season in seasons_to_unexist:
-        c.execute("DELETE FROM season_results WHERE season=?", [non_season])
-        conn.commit()
+    with conn:
+        c = conn.cursor()
+        weeks_to_unexist = c.execute(unreal_weeks_query).fetchall()
+        seasons_to_unexist = sorted(set((location, season) for (location, season, week) in weeks_to_unexist))
+        if (VERBOSE):
+            for (location, season, week) in weeks_to_unexist:
+                print("{:s} S{:d} W{:d} was not 'real' - tagging for deletion.".format(location, season, week))
+
+        for (location, season, week) in weeks_to_unexist:
+            mark_dirty(db, location, season, week)
+
+        if (weeks_to_unexist):
+            c.execute("DELETE FROM season_results WHERE (location, season) IN (SELECT location, season FROM ({:s}))".format(unreal_weeks_query))
+            c.execute("DELETE FROM weekly_results WHERE (location, season, week) IN ({:s})".format(unreal_weeks_query))
+
+    return(weeks_to_unexist, seasons_to_unexist)
     
-# getting streak information out of the database is not a simple, straightforward query
-# break that ordeal into this function here
-def get_streaks():
-    streaks = []
-    current_streaks = {}
-    season_weeks = get_season_weeks()
+# remember that a location's season results changed, and the earliest week in it that did (0: all of it, None: just the totals)
+def mark_dirty(db, location, season, week=0):
+    key = (location, int(season))
+    if (week is None):
+        db.dirty_seasons.setdefault(key, None)
+    elif (db.dirty_seasons.get(key) is None or week < db.dirty_seasons[key]):
+        db.dirty_seasons[key] = week
+
+# read (or set) a value in the summary bookkeeping table
+def get_summary_state(db, location, name, default=None):
+    conn = db.conn
+    row = conn.execute("SELECT value FROM summary_state WHERE location=? AND name=?", [location, name]).fetchone()
+    if (row is None):
+        return(default)
+    return(row[0])
+
+def set_summary_state(db, location, name, value):
+    conn = db.conn
+    conn.execute("INSERT INTO summary_state VALUES (?,?,?) ON CONFLICT (location, name) DO UPDATE SET value=excluded.value", [location, name, value])
+
+# bring the summary tables up to date with whatever changed since they were last refreshed.
+# call this after clean_database, so it only ever sees real weeks.
+def refresh_summaries(db):
+    conn = db.conn
+    with conn:
+        c = conn.cursor()
+        if (get_summary_state(db, "", "stale")):   # brand new tables (or a rebuilt database): start from nothing
+            for table in ("team_season_totals", "team_totals", "season_winners", "streak_state", "streak_history"):
+                c.execute("DELETE FROM " + table)
+            c.execute("DELETE FROM summary_state WHERE NOT (location='' AND name='ingest_version')")
+            location_seasons = c.execute("SELECT location, season FROM weekly_results UNION SELECT location, season FROM season_results").fetchall()
+        else:
+            location_seasons = list(db.dirty_seasons)
+
+        for (location, group) in itertools.groupby(sorted(location_seasons), key=operator.itemgetter(0)):
+            seasons = [season for (location, season) in group]
+            refresh_team_totals(db, location, seasons)
+            refresh_season_winners(db, location, seasons)
+
+            # streaks run across seasons, so a change to a week we've already been through means starting them over
+            streaks_through = (get_summary_state(db, location, "streak_season", 0), get_summary_state(db, location, "streak_week", 0))
+            for season in seasons:
+                week = db.dirty_seasons.get((location, season))
+                if (week is not None and (season, week) <= streaks_through):
+                    if (VERBOSE): print("{:s} S{:d} W{:d} changed after its streaks were counted, recounting all of them".format(location, season, week))
+                    c.execute("DELETE FROM streak_state WHERE location=?", [location])
+                    c.execute("DELETE FROM streak_history WHERE location=?", [location])
+                    for name in ("streak_season", "streak_week", "streak_order"):
+                        c.execute("DELETE FROM summary_state WHERE location=? AND name=?", [location, name])
+                    break
+            advance_streaks(db, location)
+
+        if (location_seasons):      # anything that's been looking at the old numbers (see cached_table_rows) needs to know
+            set_summary_state(db, "", "ingest_version", get_summary_state(db, "", "ingest_version", 0) + 1)
+    db.dirty_seasons.clear()
+
+# redo the per-season team totals for <seasons> at <location>, and push the difference into the all-time team totals
+def refresh_team_totals(db, location, seasons):
+    conn = db.conn
     c = conn.cursor()
-    
-    # for each real week, get the teams that had a score that counted
-    for season_week in season_weeks:
-        team_tuples = c.execute("SELECT team FROM weekly_results WHERE rank!=-1 AND season=? AND week=?", season_week)
-        teams = []
-        for element in team_tuples:
-            teams.append(element[0])
-        
-        for team in teams:
-            if (VERBOSE): print("++++" , team, "++++")
-            # if you were present: increment (or start) your streak in the current_streak dict
+    marks = ",".join("?" * len(seasons))
+    add_to_team_totals = """INSERT INTO team_totals SELECT location, team, {:s}SUM(weeks), {:s}SUM(points), {:s}SUM(showings), {:s}SUM(firsts)
+                            FROM team_season_totals WHERE location=? AND season IN ({:s}) GROUP BY location, team
+                            ON CONFLICT (location, team) DO UPDATE SET weeks=weeks+excluded.weeks, points=points+excluded.points,
+                                                                       showings=showings+excluded.showings, firsts=firsts+excluded.firsts"""
+
+    c.execute(add_to_team_totals.format("-", "-", "-", "-", marks), [location] + seasons)   # take the old numbers for these seasons out...
+    c.execute("DELETE FROM team_season_totals WHERE location=? AND season IN ({:s})".format(marks), [location] + seasons)
+    c.execute("""INSERT INTO team_season_totals SELECT location, season, team, COUNT(*), SUM(score), SUM(rank!=-1), SUM(rank=1)
+                 FROM weekly_results WHERE location=? AND season IN ({:s}) GROUP BY location, season, team""".format(marks), [location] + seasons)
+    c.execute(add_to_team_totals.format("", "", "", "", marks), [location] + seasons)       # ...and put the new ones in
+    c.execute("DELETE FROM team_totals WHERE location=? AND weeks=0", [location])           # teams that only ever existed in results that went away
+
+# redo the winners of <seasons> at <location> (could be more than one per season!)
+def refresh_season_winners(db, location, seasons):
+    conn = db.conn
+    c = conn.cursor()
+    marks = ",".join("?" * len(seasons))
+    c.execute("DELETE FROM season_winners WHERE location=? AND season IN ({:s})".format(marks), [location] + seasons)
+    c.execute("""INSERT INTO season_winners SELECT location, season, team, 1.0 / COUNT(*) OVER (PARTITION BY season) FROM season_results
+                 WHERE location=? AND season IN ({:s})
+                 AND score=(SELECT MAX(score) FROM season_results AS best WHERE best.location=season_results.location AND best.season=season_results.season)""".format(marks),
+              [location] + seasons)
+
+# carry the streaks at <location> on through every week that's come along since they were last counted
+def advance_streaks(db, location):
+    conn = db.conn
+    c = conn.cursor()
+    (last_season, last_week) = (get_summary_state(db, location, "streak_season", 0), get_summary_state(db, location, "streak_week", 0))
+    order = get_summary_state(db, location, "streak_order", 0)  # bookkeeping number, so ties come out the same way every time
+
+    current_streaks = {}
+    for (team, weeks, started) in c.execute("SELECT team, weeks, started FROM streak_state WHERE location=? ORDER BY started", [location]):
+        current_streaks[team] = [weeks, started]
+    ended_streaks = []
+
+    # for each new real week, get the teams that had a score that counted
+    results = c.execute("""SELECT season, week, team, rank FROM weekly_results WHERE location=? AND (season, week) > (?, ?)
+                           ORDER BY season ASC, week ASC, score DESC, team ASC""", [location, last_season, last_week]).fetchall()
+    for ((last_season, last_week), week_results) in itertools.groupby(results, key=operator.itemgetter(0, 1)):
+        teams = set()
+        for (season, week, team, rank) in week_results:
+            if (rank == -1):
+                continue
+            teams.add(team)
+            # if you were present: increment (or start) your streak
             if (team in current_streaks):
-                if (VERBOSE): print("UP IT")
-                current_streaks[team] = current_streaks[team] + 1
+                current_streaks[team][0] += 1
             else:
-                if (VERBOSE): print("NOOB")
-                current_streaks[team] = 1
-                
-        # for all teams with current streaks: if the streak was broken, move that to "streaks" and end current streak
-        ended_streaks = []
-        for streak in current_streaks:
-            if (not streak in teams):
-                if (VERBOSE): print("*** {:s} ***".format(streak))
-                if (VERBOSE): print("NOT HERE")
-                streaks.append((streak, current_streaks[streak], season_week[0], season_week[1], False))
-                ended_streaks.append(streak)
-                
-        for streak in ended_streaks:
-            del current_streaks[streak]
-        
-    # make sure current streaks appear in the list of all-time streaks, too
-    for streak in current_streaks:
-        streaks.append((streak, current_streaks[streak], season_week[0], season_week[1], True))
+                current_streaks[team] = [1, order]
+                order += 1
 
-    # sort current streaks by length
-    current_streaks = sorted(current_streaks.items(), key=lambda x: x[1])
-    current_streaks.reverse()
-    
-    # sort historical streaks by length, only take top 20
-    streaks.sort(key=operator.itemgetter(1))
-    streaks.reverse()
-    streaks = streaks[:20]
-    return(streaks, current_streaks)
-    
-# break all the seasonal margin-of-victory stuff down into one simple function call here
-def get_season_margins_of_victory():
+        # for all teams with current streaks: if the streak was broken, it goes in the history books
+        for team in [team for team in current_streaks if team not in teams]:
+            if (VERBOSE): print("*** {:s} *** NOT HERE".format(team))
+            ended_streaks.append((location, order, team, current_streaks.pop(team)[0], last_season, last_week))
+            order += 1
+
+    c.execute("DELETE FROM streak_state WHERE location=?", [location])
+    c.executemany("INSERT INTO streak_state VALUES (?,?,?,?)", [(location, team, weeks, started) for (team, (weeks, started)) in current_streaks.items()])
+    c.executemany("INSERT INTO streak_history VALUES (?,?,?,?,?,?)", ended_streaks)
+    set_summary_state(db, location, "streak_season", last_season)
+    set_summary_state(db, location, "streak_week", last_week)
+    set_summary_state(db, location, "streak_order", order)
+
+# every result at one location, read out of the database in one go and kept in memory a column at a time
+# (a few bytes per result, instead of a tuple and its objects), for the report tables that have to look over all of them.
+# team names are kept once each, in <teams>, and everywhere else a team is its place in that list.
+# weekly results are in order of season, then week, then best score first (then team): so each week's results are together,
+# with its winner up front, and <week_starts> says where each week starts (plus where the last one ends).
+# season totals are laid out the same way, a season at a time, in the season_* columns and <season_starts>.
+class Snapshot:
+    def __init__(self, db, location):
+        conn = db.conn
+        team_ids = {}
+
+        rows = conn.execute("SELECT season, week, team, rank, score FROM weekly_results WHERE location=? ORDER BY season, week, score DESC, team", [location]).fetchall()
+        (seasons, weeks, teams, ranks, scores) = zip(*rows) if rows else ((), (), (), (), ())
+        self.season = array.array("h", seasons)
+        self.week = array.array("h", weeks)
+        self.team = array.array("i", [team_ids.setdefault(team, len(team_ids)) for team in teams])
+        self.rank = array.array("h", ranks)
+        self.score = array.array("h", map(int, scores))      # (weekly scores are always whole numbers)
+        self.week_starts = group_starts(self.season, self.week)
+
+        rows = conn.execute("SELECT season, team, score FROM season_results WHERE location=? ORDER BY season, score DESC, team", [location]).fetchall()
+        (seasons, teams, scores) = zip(*rows) if rows else ((), (), ())
+        self.season_season = array.array("h", seasons)
+        self.season_team = array.array("i", [team_ids.setdefault(team, len(team_ids)) for team in teams])
+        self.season_score = array.array("d", scores)
+        self.season_starts = group_starts(self.season_season)
+
+        self.teams = list(team_ids)
+        self.team_ids = team_ids
+
+    # (start, end) of every group of results (see week_starts and season_starts)
+    def groups(self, starts):
+        return(zip(starts, itertools.islice(starts, 1, None)))
+
+# where each run of equal values (across all of <columns> at once) starts, plus where the last one ends
+def group_starts(*columns):
+    starts = array.array("i")
+    previous = None
+    for (n, key) in enumerate(zip(*columns)):
+        if (key != previous):
+            starts.append(n)
+            previous = key
+    starts.append(len(columns[0]))
+    return(starts)
+
+# the snapshot of <location>'s results as of ingest <version> (which, like cached_table_rows', is only there so the cache knows when to let go)
+@functools.lru_cache(maxsize=SNAPSHOT_CACHE_SIZE)
+def cached_snapshot(db, version, location):
+    return(Snapshot(db, location))
+
+# <location>'s results, as of the last refresh_summaries.  (call from inside db.reading.)
+# report tables being looked up side by side all want the same snapshot: the first one in loads it, and the rest wait for it.
+snapshot_lock = threading.Lock()
+def get_snapshot(db, location):
+    version = get_summary_state(db, "", "ingest_version", 0)
+    with snapshot_lock:
+        return(cached_snapshot(db, version, location))
+
+# getting streak information out of the database is not a simple, straightforward query
+# (so refresh_summaries keeps track of it as results come in, and this just reads off what it found)
+# returns the longest <limit> streaks ever at <location> (limit=None for all of them), and every streak still going
+def get_streaks(db, location, limit=20):
+    conn = db.conn
     c = conn.cursor()
+    streaks_through = (get_summary_state(db, location, "streak_season", 0), get_summary_state(db, location, "streak_week", 0))
+    order = get_summary_state(db, location, "streak_order", 0)
+
+    # streaks still going count as all-time streaks too.  when two streaks are the same length, the one recorded later wins out
+    # (and the ones still going get recorded last, in the order they started)
+    current = c.execute("SELECT team, weeks FROM streak_state WHERE location=? ORDER BY started", [location]).fetchall()
+    candidates = [(weeks, order + n, (team, weeks) + streaks_through + (True,)) for (n, (team, weeks)) in enumerate(current)]
+    ended = c.execute("SELECT recorded, team, weeks, season, week FROM streak_history WHERE location=? ORDER BY weeks DESC, recorded DESC LIMIT ?",
+                      [location, -1 if limit is None else limit])
+    for (recorded, team, weeks, season, week) in ended:
+        candidates.append((weeks, recorded, (team, weeks, season, week, False)))
+
+    if (limit is None):
+        streaks = sorted(candidates, reverse=True)
+    else:
+        streaks = heapq.nlargest(limit, candidates)
+    streaks = [streak for (weeks, order, streak) in streaks]
+
+    # sort current streaks by length (most recently started first, on a tie)
+    current_streaks = sorted(reversed(current), key=operator.itemgetter(1), reverse=True)
+    return(streaks, current_streaks)
     
-    # get a list of all the seasons that actually existed
-    seasons = get_seasons()
+# break all the seasonal margin-of-victory stuff (at <location>) down into one simple function call here
+def get_season_margins_of_victory(db, location):
+    snapshot = get_snapshot(db, location)
+    (team, score) = (snapshot.season_team, snapshot.season_score)
+
+    # every season's teams are already lined up by score: the winner, then the runner up.
+    # (seasons with fewer than two teams don't have a runner up, so they drop out.)
+    # biggest margins first; on a tie, the more recent season comes first.
+    top_two = [(score[start] - score[start + 1], snapshot.season_season[start], start) for (start, end) in snapshot.groups(snapshot.season_starts) if end - start >= 2]
+    top_two.sort(reverse=True)
+
+    # jam the (season, winner, loser, delta) tuples into the return array
     results = []
-    
-    # for every season: get the two top scores, calculate the difference, jam the (season, winner, loser, delta) tuple into the return array
-    for season in seasons:
-        top_two = c.execute("SELECT team, score FROM season_results WHERE season={:d} ORDER BY score DESC LIMIT 2".format(season))
-        top_two_tuples = top_two.fetchall()
-        if (len(top_two_tuples)==2):
-            (win_team, win_score) = top_two_tuples[0]
-            (lose_team, lose_score) = top_two_tuples[1]
-            margin = win_score - lose_score
-            results.append((season, "{:s} ({:.0f})".format(win_team, win_score), "{:s} ({:.0f})".format(lose_team, lose_score), margin))
-    results.sort(key=operator.itemgetter(3))    # sort on the margin of victory
-    results.reverse()
+    for (margin, season, start) in top_two:
+        results.append((season, "{:s} ({:.0f})".format(snapshot.teams[team[start]], score[start]),
+                        "{:s} ({:.0f})".format(snapshot.teams[team[start + 1]], score[start + 1]), margin))
     return(results)
 
-# break all the weekly margin-of-victory stuff down into one simple function call here
-def get_week_margins_of_victory():
-    season_weeks = get_season_weeks()
+# break all the weekly margin-of-victory stuff (at <location>) down into one simple function call here
+def get_week_margins_of_victory(db, location):
+    snapshot = get_snapshot(db, location)
+    (team, score) = (snapshot.team, snapshot.score)
+
+    # same idea as the seasons, but for every season and week, and only the top 20
+    top_two = heapq.nlargest(20, ((score[start] - score[start + 1], snapshot.season[start], snapshot.week[start], start)
+                                  for (start, end) in snapshot.groups(snapshot.week_starts) if end - start >= 2))
+
+    # jam the (season, week, winner, loser, delta) tuples into the return array
     results = []
-    c = conn.cursor()
-          
-    # for every season and week: get the two top scores, calculate the difference, jam the (season, week, winner, loser, delta) tuple into the return array
-    for (season, week) in season_weeks:
-        top_two = c.execute("SELECT team, score FROM weekly_results WHERE season={:d} AND week={:d} ORDER BY score DESC LIMIT 2".format(season, week))
-        (win_team, win_score) = top_two.fetchone()
-        (lose_team, lose_score) = top_two.fetchone()
-        margin = win_score - lose_score
-        results.append((season, week, "{:s} ({:.0f})".format(win_team, win_score), "{:s} ({:.0f})".format(lose_team, lose_score), margin))
-    results.sort(key=operator.itemgetter(4))    # sort on the margin of victory
-    results.reverse()
-    results = results[:20]                      # only take the top 20 results
+    for (margin, season, week, start) in top_two:
+        results.append((season, week, "{:s} ({:.0f})".format(snapshot.teams[team[start]], score[start]),
+                        "{:s} ({:.0f})".format(snapshot.teams[team[start + 1]], score[start + 1]), float(margin)))
     return(results)
 
-# return a list of (team -> number of season wins) pairs for the history of trivia
-def get_seasons_won_by_team():
+# return a list of (team -> number of season wins) pairs for the history of trivia at <location>
+def get_seasons_won_by_team(db, location):
+    conn = db.conn
     c = conn.cursor()
-
-    # step one: get a list of seasons
-    seasons = get_seasons()
     team_wins = {}
     
-    # for every season: get the top score for that season
-    for season in seasons:
-        top_score_rows = c.execute("SELECT MAX(score) FROM season_results WHERE season={:d}".format(season))
-        top_score_tuple = top_score_rows.fetchone()
-        top_score = top_score_tuple[0]
-        
-        # get the list of teams that had the top score for a given season (could be more than one!)
-        winning_teams = c.execute("SELECT team FROM season_results WHERE season={:d} AND score={:f}".format(season, top_score))
-        winning_team_tuples = winning_teams.fetchall()
-        if (VERBOSE): print(winning_team_tuples)
-        
-        # for every team with the top score: give a fractional victory depending on how many teams won out
-        for team_tuple in winning_team_tuples:
-            team = team_tuple[0]
-            num_wins = 0.0
-            if (team in team_wins):
-                num_wins = team_wins[team]
-            num_wins = num_wins + (1/len(winning_team_tuples))  # "enjoy your third of a win or whatevs."
-            team_wins[team] = num_wins
+    # for every season winner: give a fractional victory depending on how many teams won out
+    for (team, share) in c.execute("SELECT team, share FROM season_winners WHERE location=? ORDER BY season, team", [location]):
+        team_wins[team] = team_wins.get(team, 0.0) + share      # "enjoy your third of a win or whatevs."
     
     # sort by the number of wins, then return
     team_wins = sorted(team_wins.items(), key=lambda x: x[1])
@@ -423,137 +1629,545 @@ def get_seasons_won_by_team():
     return(team_wins)
  
 
-def get_averages():
-    retval = []
-    seasons = get_seasons()     # this gets the seasons in ascending order
-    seasons.reverse()           # but we want them in descending
-    c = conn.cursor()
-    
-    for season in seasons:
-        # get the best score for each week in the season.  average all of those values together.
-        weeks_results = c.execute("SELECT DISTINCT week FROM weekly_results WHERE season={:d}".format(season))
-        weeks_tuples = weeks_results.fetchall()
-        max_total = 0.0
-        num_weeks = 0
-        for week_tuple in weeks_tuples:
-            week = week_tuple[0]
-            max_score_for_week_results = c.execute("SELECT MAX(score) FROM weekly_results WHERE season={:d} AND week={:d}".format(season, week))
-            max_score_for_week_tuple = max_score_for_week_results.fetchone()
-            max_score_for_week = max_score_for_week_tuple[0]
-            
-            if (max_score_for_week > 0):
-                max_total += max_score_for_week
-                num_weeks += 1
-                if (VERBOSE): print(season, week, max_score_for_week)
-        average_max = max_total / num_weeks     # average of all the best weekly scores
-
-        # now, get the team that won the season, and figure out their average weekly score
-        # ignore the "multiple teams tied for the season win!" for now
-        winning_team_results = c.execute("SELECT team FROM season_results WHERE season={:d} ORDER BY score DESC LIMIT 1".format(season))
-        winning_team_tuple = winning_team_results.fetchone()
-        winning_team = winning_team_tuple[0]
-        
-        winning_team = winning_team.replace("'", "''")      # to make MYSQL happy with teams with single-quotes
-        average_winner_score_results = c.execute("SELECT AVG(score) FROM weekly_results WHERE season={:d} AND team='{:s}'".format(season, winning_team))
-        average_winner_score_tuple = average_winner_score_results.fetchone()
-        average_winner_score = average_winner_score_tuple[0]
-    
-        retval.append((season, "{:.2f}".format(average_max), "{:.2f}".format(average_winner_score)))
+# for every season at <location> (newest first): the average of each week's best score, and the season winner's average weekly score
+def get_averages(db, location):
+    snapshot = get_snapshot(db, location)
+    (seasons, teams, scores) = (snapshot.season, snapshot.team, snapshot.score)
 
+    # get the best score for each week in the season (the first one in each week).  average all of those values together.
+    # then get the team that won the season, and figure out their average weekly score
+    # (ignore the "multiple teams tied for the season win!" for now)
+    best = {}
+    for (start, end) in snapshot.groups(snapshot.week_starts):
+        if (scores[start] > 0):
+            best.setdefault(seasons[start], []).append(scores[start])
+    winners = dict((snapshot.season_season[start], snapshot.season_team[start]) for (start, end) in snapshot.groups(snapshot.season_starts))
+    winner_scores = {}
+    for (season, team, score) in zip(seasons, teams, scores):
+        if (winners.get(season) == team):
+            winner_scores.setdefault(season, []).append(score)
+
+    retval = []
+    for season in sorted(winners, reverse=True):
+        if (season not in best or season not in winner_scores):     # a winner without a single weekly score?  nothing to average.
+            continue
+        retval.append((season, "{:.2f}".format(sum(best[season]) / len(best[season])), "{:.2f}".format(sum(winner_scores[season]) / len(winner_scores[season]))))
     return(retval)
  
-# assuming there's a database full of interesting information: look at it.
-# do some clever queries and print a mess of tables based on what all we can find
-def analyze_database():
-    global writefile
-    global last_week_tuple
+# the tables that make up a report.  each one takes a location and a team, and returns a list of row tuples
+# (see render_table).  the leaderboard's tables look at every location at once, so they don't care which one they get.
 
-    c = conn.cursor()
-    
-    # write out HTML header
-    writefile.write('<HTML>\n<HEAD>\n<TITLE>PubStumpers Trivia Info Dump</TITLE>\n</HEAD>\n<BODY BGCOLOR="999999" TEXT="000000" LINK="CCCCCC" VLINK="CCCCCC" ALINK="FFFFFF">\n')
+def highest_team_weeks(db, location, team):
+    s = get_snapshot(db, location)
+    if (team not in s.team_ids):
+        return([])
+    team_id = s.team_ids[team]
+    weeks = heapq.nsmallest(20, (n for n in range(len(s.team)) if s.team[n] == team_id), key=lambda n: (-s.score[n], -s.season[n], -s.week[n]))
+    return([(team, s.season[n], s.week[n], float(s.score[n]), s.rank[n]) for n in weeks])
+
+def best_seasons(db, location, team):
+    s = get_snapshot(db, location)
+    seasons = heapq.nsmallest(20, range(len(s.season_team)), key=lambda n: (-s.season_score[n], -s.season_season[n]))
+    return([(s.teams[s.season_team[n]], s.season_season[n], s.season_score[n]) for n in seasons])
+
+def first_place_finishes(db, location, team):
+    conn = db.conn
+    # limit ourselves to teams that took first place at least twice
+    return(conn.execute("SELECT team, firsts FROM team_totals WHERE location=? AND firsts>2 ORDER BY firsts DESC, team DESC", [location]).fetchall())
+
+def lowest_firsts(db, location, team):
+    s = get_snapshot(db, location)
+    weeks = heapq.nsmallest(20, (n for n in range(len(s.rank)) if s.rank[n] == 1), key=lambda n: (s.score[n], -s.season[n], -s.week[n]))
+    return([(s.teams[s.team[n]], s.season[n], s.week[n], float(s.score[n])) for n in weeks])
+
+def best_weeks(db, location, team):
+    s = get_snapshot(db, location)
+    weeks = heapq.nsmallest(20, (n for n in range(len(s.season)) if s.season[n] > 5), key=lambda n: (-s.score[n], -s.season[n]))
+    return([(s.teams[s.team[n]], s.season[n], s.week[n], float(s.score[n])) for n in weeks])
+
+def longest_streaks(db, location, team):
+    return(get_streaks(db, location, STREAK_LIMIT)[0])
+
+def active_streaks(db, location, team):
+    return(get_streaks(db, location, STREAK_LIMIT)[1])
+
+def total_points(db, location, team):
+    conn = db.conn
+    return(conn.execute("SELECT team, points FROM team_totals WHERE location=? ORDER BY points DESC, team LIMIT 20", [location]).fetchall())
+
+def total_showings(db, location, team):
+    conn = db.conn
+    return(conn.execute("SELECT team, showings FROM team_totals WHERE location=? AND showings>0 ORDER BY showings DESC, team LIMIT 20", [location]).fetchall())
+
+def location_summaries(db, location, team):
+    conn = db.conn
+    return(conn.execute("SELECT location, COUNT(DISTINCT season), MAX(season), COUNT(DISTINCT team) FROM team_season_totals GROUP BY location ORDER BY location").fetchall())
+
+def season_wins_everywhere(db, location, team):
+    conn = db.conn
+    return(conn.execute("SELECT team, COUNT(DISTINCT location), SUM(share) FROM season_winners GROUP BY team ORDER BY SUM(share) DESC, team LIMIT 20").fetchall())
+
+def first_place_finishes_everywhere(db, location, team):
+    conn = db.conn
+    return(conn.execute("SELECT team, COUNT(*), SUM(firsts) FROM team_totals GROUP BY team HAVING SUM(firsts)>0 ORDER BY SUM(firsts) DESC, team LIMIT 20").fetchall())
+
+def total_points_everywhere(db, location, team):
+    conn = db.conn
+    return(conn.execute("SELECT team, COUNT(*), SUM(points) FROM team_totals GROUP BY team ORDER BY SUM(points) DESC, team LIMIT 20").fetchall())
+
+def total_showings_everywhere(db, location, team):
+    conn = db.conn
+    return(conn.execute("SELECT team, COUNT(*), SUM(showings) FROM team_totals GROUP BY team HAVING SUM(showings)>0 ORDER BY SUM(showings) DESC, team LIMIT 20").fetchall())
+
+# name (as used in URLs) -> (title, column headers, where the rows come from, whether the rows depend on the team)
+# titles can have a {:s} in them for the team's name.  tables show up in reports in this order.
+REPORT_TABLES = {
+    "highest_team_weeks": ("Highest {:s} Weeks Ever", ["Team", "Season", "Week", "Score", "Rank"], highest_team_weeks, True),
+    "best_seasons": ("Best Seasons Ever", ["Team", "Season", "Score"], best_seasons, False),
+    "season_wins": ("Seasons Won By Each Team", ["Team", "Seasons Won"], lambda db, location, team: get_seasons_won_by_team(db, location), False),
+    "season_margins": ("Season Margins of Victory", ["Season", "Winner", "Runner Up", "Margin"], lambda db, location, team: get_season_margins_of_victory(db, location), False),
+    "week_margins": ("Biggest Weekly Margins of Victory", ["Season", "Week", "Winner", "Runner Up", "Margin"], lambda db, location, team: get_week_margins_of_victory(db, location), False),
+    "first_place_finishes": ("First Place Finishes Ever", ["Team", "1st Place Finishes"], first_place_finishes, False),
+    "lowest_firsts": ("Lowest First Place Scores", ["Team", "Season", "Week", "Score"], lowest_firsts, False),
+    "best_weeks": ("Highest Scoring Weeks Ever (After Season 5)", ["Team", "Season", "Week", "Score"], best_weeks, False),
+    "longest_streaks": ("Longest Consecutive Weeks Streaks", ["Team", "Weeks", "Season #", "Week #"], longest_streaks, False),
+    "active_streaks": ("Active Consecutive Weeks Streaks", ["Team", "Weeks"], active_streaks, False),
+    "total_points": ("Total Points Ever", ["Team", "Cumulative Score"], total_points, False),
+    "total_showings": ("Total Showings Ever", ["Team", "Times Present"], total_showings, False),
+    "weekly_trends": ("Weekly Trends", ["Season", "Average Top Score", "Top Team's Average Score"], lambda db, location, team: get_averages(db, location), False),
+}
+LEADERBOARD_TABLES = {
+    "locations": ("Locations", ["Location", "Seasons", "Latest Season", "Teams"], location_summaries, False),
+    "season_wins": ("Seasons Won Everywhere", ["Team", "Locations", "Seasons Won"], season_wins_everywhere, False),
+    "first_place_finishes": ("First Place Finishes Everywhere", ["Team", "Locations", "1st Place Finishes"], first_place_finishes_everywhere, False),
+    "total_points": ("Total Points Everywhere", ["Team", "Locations", "Cumulative Score"], total_points_everywhere, False),
+    "total_showings": ("Total Showings Everywhere", ["Team", "Locations", "Times Present"], total_showings_everywhere, False),
+}
+
+# which version of the data the database holds: goes up every time refresh_summaries takes in something new
+def get_ingest_version(db):
+    with db.reading():
+        return(get_summary_state(db, "", "ingest_version", 0))
+
+# the rows for one report table, straight out of memory if nobody's ingested anything since they were last looked up.
+# (<version> is only there to be part of what the cache remembers the rows by; <team> is None unless the table cares.)
+@functools.lru_cache(maxsize=REPORT_CACHE_SIZE)
+def cached_table_rows(db, version, tables, name, location, team):
+    (title, header_arr, get_rows, uses_team) = (REPORT_TABLES if tables == "report" else LEADERBOARD_TABLES)[name]
+    with db.reading():
+        return(tuple(get_rows(db, location, team)))
+
+# the (name, title, column headers, rows) for each of the report tables asked for (all of them, if <names> is None)
+# (titles that are headed for a web page get the team's name made safe for HTML)
+# the tables don't depend on each other, so (with db.concurrent_reads) they're all looked up at once, REPORT_WORKERS at a time,
+# and come out in order as each one's ready: the whole lot takes about as long as the slowest table, instead of all of them added up.
+def report_tables(db, tables, location, team, names=None, for_html=True):
+    table_defs = REPORT_TABLES if tables == "report" else LEADERBOARD_TABLES
+    version = get_ingest_version(db)
+    names = list(table_defs if names is None else names)
+    lookups = [(db, version, tables, name, location, team if table_defs[name][3] else None) for name in names]
+
+    if (db.concurrent_reads and len(names) > 1):
+        with concurrent.futures.ThreadPoolExecutor(min(REPORT_WORKERS, len(names))) as pool:
+            rows = [pool.submit(cached_table_rows, *lookup) for lookup in lookups]
+            for (name, table_rows) in zip(names, rows):
+                yield table_entry(table_defs, name, team, table_rows.result(), for_html)
+    else:
+        for (name, lookup) in zip(names, lookups):
+            yield table_entry(table_defs, name, team, cached_table_rows(*lookup), for_html)
+
+def table_entry(table_defs, name, team, rows, for_html):
+    (title, header_arr, get_rows, uses_team) = table_defs[name]
+    return((name, title.replace("{:s}", html.escape(team) if for_html else team), header_arr, rows))
+
+# where a location's report goes
+def report_file(location):
+    if (location == DEFAULT_LOCATION):
+        return(HTMLFILE)
+    return(location + ".html")
+
+# the last real season/week at <location>, for display
+def get_last_week(db, location):
+    with db.reading():
+        return(db.conn.execute("SELECT season, week FROM weekly_results WHERE location=? ORDER BY season DESC, week DESC LIMIT 1", [location]).fetchone())
+
+# assuming there's a database full of interesting information about <location>: look at it.
+# yields a mess of tables based on what all we can find, all about <team> (see write_page and friends for where it goes).
+# just the tables in <names>, if there are any.
+def render_report(db, location, team=None, names=None):
+    if (team is None):
+        team = SELECTED_TEAM
+    last_week_tuple = get_last_week(db, location)
+
+    # HTML header
     now = datetime.datetime.now()
     now_string = datetime.date.strftime(now, "%a %Y-%b-%d %H:%M")
-    writefile.write('<FONT COLOR="ffffff">')
-    writefile.write('<i>Page created at {:s}.</i><br />'.format(now_string))
-    writefile.write('<i>Last week processed: Season {:d}, Week {:d}.</i><br />'.format(last_week_tuple[0], last_week_tuple[1]))
-    writefile.write('<i>Data analyzed procured from <a href="{:s}">this source</a>.</i><p />'.format(DATA_SOURCE))
-    writefile.write('</FONT>')
-
-    highest_scores_ever = c.execute("SELECT team, season, week, score, rank FROM weekly_results WHERE team='{:s}' ORDER BY score DESC, season DESC, week DESC LIMIT 20".format(SELECTED_TEAM))
-    print_table("Highest {:s} Weeks Ever".format(SELECTED_TEAM), ["Team", "Season", "Week", "Score", "Rank"], highest_scores_ever)
-	
-    best_seasons_ever = c.execute("SELECT team, season, score FROM season_results ORDER BY score DESC, season DESC LIMIT 20")
-    print_table("Best Seasons Ever", ["Team", "Season", "Score"], best_seasons_ever)
-    
-    season_wins_by_team = get_seasons_won_by_team()
-    print_table("Seasons Won By Each Team", ["Team", "Seasons Won"], season_wins_by_team)
+    header = [PAGE_START.format("PubStumpers Trivia Info Dump"), '<FONT COLOR="ffffff">']
+    header.append('<i>Page created at {:s}.</i><br />'.format(now_string))
+    if (last_week_tuple is None):       # a location with nothing played yet
+        header.append('<i>Last week processed: none yet.</i><br />')
+    else:
+        header.append('<i>Last week processed: Season {:d}, Week {:d}.</i><br />'.format(last_week_tuple[0], last_week_tuple[1]))
+    if (len(LOCATIONS) > 1):
+        header.append('<i>See how everybody does everywhere on <a href="{:s}">the leaderboard</a>.</i><br />'.format(LEADERBOARD_FILE))
+    header.append('<i>Data analyzed procured from <a href="{:s}">this source</a>.</i><p />'.format(LOCATIONS[location]))
+    header.append('</FONT>')
+    yield("".join(header))
 
-    margins_data = get_season_margins_of_victory()
-    print_table("Season Margins of Victory", ["Season", "Winner", "Runner Up", "Margin"], margins_data)
+    for (name, title, header_arr, rows) in report_tables(db, "report", location, team, names):
+        yield from render_table(title, header_arr, rows, team)
 
-    week_margins_data = get_week_margins_of_victory()
-    print_table("Biggest Weekly Margins of Victory", ["Season", "Week", "Winner", "Runner Up", "Margin"], week_margins_data)
-    
-    raw_first_place_showings = c.execute("SELECT team, COUNT(rank) FROM weekly_results WHERE rank='1' GROUP BY team ORDER BY COUNT(rank) DESC")
-    first_place_showings = []
-    for tuple in raw_first_place_showings:
-        if (tuple[1]>2):        # limit ourselves to teams that took first place at least twice
-            first_place_showings.append(tuple)
-    print_table("First Place Finishes Ever", ["Team", "1st Place Finishes"], first_place_showings)
-
-    lowest_firsts = c.execute("SELECT team, season, week, score FROM weekly_results WHERE rank='1' ORDER BY score ASC, season DESC LIMIT 20")
-    print_table("Lowest First Place Scores", ["Team", "Season", "Week", "Score"], lowest_firsts)
-    
-    best_weeks_ever = c.execute("SELECT team, season, week, score FROM weekly_results WHERE season>5 ORDER BY score DESC, season DESC LIMIT 20")
-    print_table("Highest Scoring Weeks Ever (After Season 5)", ["Team", "Season", "Week", "Score"], best_weeks_ever)
-    
-    (streaks, current_streaks) = get_streaks()
-    print_table("Longest Consecutive Weeks Streaks", ["Team", "Weeks", "Season #", "Week #"], streaks)
-    print_table("Active Consecutive Weeks Streaks", ["Team", "Weeks"], current_streaks)
- 
-    total_points_ever = c.execute("SELECT team, SUM(score) AS total FROM weekly_results GROUP BY team ORDER BY total DESC LIMIT 20")
-    print_table("Total Points Ever", ["Team", "Cumulative Score"], total_points_ever)
+    # HTML footer
+    yield(PAGE_END)
 
-    total_showings_ever = c.execute("SELECT team, COUNT(*) AS shows FROM weekly_results WHERE rank!='-1' GROUP BY team ORDER BY shows DESC LIMIT 20")
-    print_table("Total Showings Ever", ["Team", "Times Present"], total_showings_ever)
+# with more than one location: how every team does everywhere, all added up (teams go by name, wherever they play)
+def render_leaderboard(db, team=None, names=None):
+    if (team is None):
+        team = SELECTED_TEAM
+    # HTML header
+    now = datetime.datetime.now()
+    now_string = datetime.date.strftime(now, "%a %Y-%b-%d %H:%M")
+    header = [PAGE_START.format("PubStumpers Trivia Leaderboard"), '<FONT COLOR="ffffff">']
+    header.append('<i>Page created at {:s}.</i><br />'.format(now_string))
+    header.append('<i>Each location on its own:')
+    for location in LOCATIONS:
+        header.append(' <a href="{:s}">{:s}</a>'.format(report_file(location), location))
+    header.append('</i><p />')
+    header.append('</FONT>')
+    yield("".join(header))
 
-    averages = get_averages()
-    print_table("Weekly Trends", ["Season", "Average Top Score", "Top Team's Average Score"], averages)
+    for (name, title, header_arr, rows) in report_tables(db, "leaderboard", None, team, names):
+        yield from render_table(title, header_arr, rows, team)
 
-    # write out HTML footer
-    writefile.write('</BODY>\n</HTML>\n')
+    # HTML footer
+    yield(PAGE_END)
 
-# MAIN PROGRAM STARTS HERE
-#
-start_time = datetime.datetime.now()
+# the same tables as render_report/render_leaderboard, as JSON
+def render_json(db, tables, location, team=None, names=None):
+    if (team is None):
+        team = SELECTED_TEAM
+    page = {"location": location, "team": team, "tables": []}
+    if (tables == "report"):
+        page["last_week"] = get_last_week(db, location)
+    for (name, title, header_arr, rows) in report_tables(db, tables, location, team, names, for_html=False):
+        page["tables"].append({"name": name, "title": title, "columns": header_arr, "rows": rows})
+    yield(json.dumps(page))
+
+# everywhere a rendered page (any bunch of text chunks, like render_report hands back) can go:
+# a file on disk (swapped in whole, so nobody ever sees half a report)...
+def write_page(path, chunks):
+    with open(path + ".part", "w", buffering=REPORT_BUFFER) as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+    os.replace(path + ".part", path)
+
+# ...bytes in memory...
+def page_bytes(chunks):
+    return("".join(chunks).encode())
+
+# ...or a WSGI response, which goes out a chunk at a time as it gets rendered
+def wsgi_page(start_response, chunks, content_type="text/html"):
+    start_response("200 OK", [("Content-Type", content_type + "; charset=utf-8")])
+    return(chunk.encode() for chunk in chunks)
+
+# a WSGI app for the reports in <db>: /<report file> for each location (/ for DEFAULT_LOCATION), and the leaderboard.
+# swap .html for .json to get the numbers instead of the page.
+# ?team=<name> puts any team where SELECTED_TEAM usually goes, and ?table=<name> (as many as you like) picks out just those tables.
+def make_report_app(db):
+    return(functools.partial(report_app, db))
+
+def report_app(db, environ, start_response):
+    path = environ.get("PATH_INFO", "/").lstrip("/") or HTMLFILE
+    query = urllib.parse.parse_qs(environ.get("QUERY_STRING", ""))
+    team = normalize_team_name(query.get("team", [SELECTED_TEAM])[0].lower())
+    names = query.get("table")
+    (base, extension) = os.path.splitext(path)
+
+    if (base + ".html" == LEADERBOARD_FILE):
+        (tables, location) = ("leaderboard", None)
+    else:
+        (tables, location) = ("report", None)
+        for candidate in LOCATIONS:
+            if (base + ".html" == report_file(candidate)):
+                location = candidate
+    table_defs = REPORT_TABLES if tables == "report" else LEADERBOARD_TABLES
+    if ((tables == "report" and location is None) or extension not in (".html", ".json") or any(name not in table_defs for name in (names or []))):
+        start_response("404 Not Found", [("Content-Type", "text/plain; charset=utf-8")])
+        return([b"no such report\n"])
+
+    if (extension == ".json"):
+        return(wsgi_page(start_response, render_json(db, tables, location, team, names), "application/json"))
+    if (tables == "leaderboard"):
+        return(wsgi_page(start_response, render_leaderboard(db, team, names)))
+    return(wsgi_page(start_response, render_report(db, location, team, names)))
+
+# the standard library's WSGI server, with a thread per request so one slow reader doesn't hold up everybody else
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, wsgiref.simple_server.WSGIServer):
+    daemon_threads = True
+
+# serve the reports over HTTP (straight out of the database, no website required) until somebody hits ctrl-C
+def serve(db, port=None):
+    if (port is None):
+        port = SERVE_PORT
+    server = wsgiref.simple_server.make_server(SERVE_HOST, port, make_report_app(db), server_class=ThreadingWSGIServer)
+    print("serving reports from {:s} on http://{:s}:{:d}/".format(db.path, SERVE_HOST, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+# a whole run, one stage at a time: work out what's out there, download it, read it into the database,
+# tidy up, bring the summaries up to date, and write out the reports.  run() does the lot, in that order.
+class Pipeline:
+    def __init__(self, db=None, reset=None, purge_last_season=None, incremental=None, profile=False, stream=None):
+        reset = reset if reset is not None else RESET_DATABASE
+        self.db = db if db is not None else Database(reset=reset, profile=profile)
+        self.reset = reset
+        self.purge_last_season = purge_last_season if purge_last_season is not None else PURGE_LAST_SEASON
+        self.incremental = incremental if incremental is not None else INCREMENTAL_INGEST
+        self.stream = stream if stream is not None else STREAM_INGEST      # rebuilds fetch and ingest at the same time (see fetch_and_ingest)
+        self.stream_metrics = {}        # how each step of that went (see stream_seasons)
+        self.last_seasons = {}          # location -> newest season
+        self.location_seasons = []      # (location, season) pairs this run is working on
+        self.pages_asked_for = 0
+        self.pages_changed = 0          # how many of those were new or changed (see get_season)
+        self.stage_times = {}           # stage -> seconds (in the order they ran)
+
+    # work out how many seasons there are to look at, at every location
+    def discover(self):
+        for location in LOCATIONS:
+            if (DISCOVER_LAST_SEASON):
+                self.last_seasons[location] = discover_last_season(location, LAST_SEASON)
+            else:
+                self.last_seasons[location] = LAST_SEASON
 
-# connect to (or create) the database   
-conn = connect_database()
+    # which (location, season) pages this run looks at: all of them for a rebuild, otherwise (maybe) each location's newest season
+    def wanted_seasons(self):
+        location_seasons = []
+        for location in LOCATIONS:
+            if (self.reset):
+                location_seasons.extend((location, season) for season in range(1, self.last_seasons[location]+1))
+            elif (self.purge_last_season):
+                location_seasons.append((location, self.last_seasons[location]))
+        return(location_seasons)
 
-# download and read in files, if necessary
-seasons = []
-if (PURGE_LAST_SEASON):
-	seasons.append(LAST_SEASON)
-if (RESET_DATABASE):
-    seasons = list(range(1, LAST_SEASON+1))
+    # download files, if necessary (every location's pages get fetched together)
+    def fetch(self):
+        discard_fetched_pages()         # anything left over from a run that didn't get as far as ingesting
+        self.location_seasons = self.wanted_seasons()
+        self.pages_asked_for = len(self.location_seasons)
+        changed_seasons = fetch_seasons(self.location_seasons, self.purge_last_season)
+        self.pages_changed = len(changed_seasons)
+        if (not self.reset):
+            self.location_seasons = changed_seasons     # unchanged pages are already in the database exactly as they'd be parsed again
+
+    # read in whatever got downloaded
+    def ingest(self):
+        if (self.reset):
+            parse_seasons(self.db, self.location_seasons)
+        elif (self.incremental):
+            for (location, season) in self.location_seasons:
+                sync_season(self.db, location, season)
+        else:
+            for (location, season) in self.location_seasons:
+                purge_season(self.db, location, season)
+            parse_seasons(self.db, self.location_seasons)
+        save_page_cache()
+
+    # fetch and ingest, for a rebuild, with each page getting parsed and written as soon as it's in (see stream_seasons)
+    def fetch_and_ingest(self):
+        discard_fetched_pages()
+        self.location_seasons = self.wanted_seasons()
+        self.pages_asked_for = len(self.location_seasons)
+        self.stream_metrics = stream_seasons(self.db, self.location_seasons, self.purge_last_season)
+        self.pages_changed = self.stream_metrics["fetch"]["changed"]
+        save_page_cache()
+
+    def clean(self):
+        clean_database(self.db)
+
+    def summarize(self):
+        refresh_summaries(self.db)
+
+    # print neat things about all that data: a page per location (or just the ones in <locations>), and (if there's more than one) how they all stack up
+    def report(self, locations=None):
+        for location in (LOCATIONS if locations is None else locations):
+            with self.timed("report/" + location):
+                write_page(report_file(location), render_report(self.db, location))
+        if (len(LOCATIONS) > 1):
+            with self.timed("report/leaderboard"):
+                write_page(LEADERBOARD_FILE, render_leaderboard(self.db))
+
+    def run(self):
+        if (self.reset and self.stream):
+            stages = (self.discover, self.fetch_and_ingest, self.clean, self.summarize, self.report)
+        else:
+            stages = (self.discover, self.fetch, self.ingest, self.clean, self.summarize, self.report)
+        for stage in stages:
+            with self.timed(stage.__name__):
+                stage()
+
+    # remember how long whatever's inside the with block takes, as <stage>
+    @contextlib.contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0) + time.perf_counter() - start
+
+    # everything we know about where this run's time went, ready for json.dumps
+    def run_record(self):
+        queries = {}
+        for (owner, (count, seconds)) in sorted(self.db.query_stats().items(), key=lambda item: -item[1][1]):
+            queries[owner] = {"queries": count, "seconds": round(seconds, 6)}
+        return({
+            "finished": datetime.datetime.now().isoformat(timespec="seconds"),
+            "stages": dict((stage, round(seconds, 6)) for (stage, seconds) in self.stage_times.items()),
+            "pages_asked_for": self.pages_asked_for,
+            "pages_changed": self.pages_changed,
+            "queries": queries,
+            "streams": self.stream_metrics,
+        })
+
+# a run record (see Pipeline.run_record) as a couple of plain text tables
+def print_run_record(record):
+    print("{:<32s} {:>10s}".format("stage", "seconds"))
+    for (stage, seconds) in record["stages"].items():
+        print("{:<32s} {:>10.3f}".format(stage, seconds))
+    print("pages: {:d} asked for, {:d} changed".format(record["pages_asked_for"], record["pages_changed"]))
+    if (record.get("streams")):
+        print()
+        print("{:<32s} {:>10s} {:>10s} {:>10s} {:>10s} {:>12s}".format("streamed step", "pages", "per second", "busy", "starved", "backpressure"))
+        for (name, stats) in record["streams"].items():
+            print("{:<32s} {:>10d} {:>10.1f} {:>10.3f} {:>10.3f} {:>12.3f}".format(name, stats["items"], stats["per_second"], stats["busy"], stats["starved"], stats["backpressure"]))
+    if (record["queries"]):
+        print()
+        print("{:<32s} {:>10s} {:>10s}".format("function", "queries", "seconds"))
+        for (owner, stats) in record["queries"].items():
+            print("{:<32s} {:>10d} {:>10.3f}".format(owner, stats["queries"], stats["seconds"]))
+
+# keeps checking the website for new results, and only re-ingests and rewrites reports when some actually turn up.
+# checks come every WATCH_FAST_POLL seconds during the RESULTS_POSTED windows and every WATCH_SLOW_POLL seconds otherwise
+# (but never sleeping through the start of a window).  the database connection, and everything cached off it, stays warm in between.
+# <now> and <sleep> are how it tells and passes the time (hand it pretend ones to run it on a pretend clock).
+class Watcher:
+    def __init__(self, pipeline=None, now=datetime.datetime.now, sleep=time.sleep):
+        self.pipeline = pipeline if pipeline is not None else Pipeline(reset=False, purge_last_season=True)
+        self.now = now
+        self.sleep = sleep
+        self.polls = 0
+        self.updates = 0
+
+    # is <when> inside one of the RESULTS_POSTED windows?  returns (True, None) if so, or (False, when the next one starts) if not
+    def window(self, when):
+        monday = datetime.datetime.combine(when.date() - datetime.timedelta(days=when.weekday()), datetime.time())
+        next_start = None
+        for (weekday, from_hour, until_hour) in RESULTS_POSTED:
+            for weeks in (-1, 0, 1):        # (last week's window might run on into this week)
+                start = monday + datetime.timedelta(days=weekday + 7 * weeks, hours=from_hour)
+                end = monday + datetime.timedelta(days=weekday + 7 * weeks, hours=until_hour)
+                if (start <= when < end):
+                    return(True, None)
+                if (start > when and (next_start is None or start < next_start)):
+                    next_start = start
+        return(False, next_start)
+
+    # when to check next, after checking at <when>
+    def next_poll(self, when):
+        (in_window, next_start) = self.window(when)
+        if (in_window):
+            return(when + datetime.timedelta(seconds=WATCH_FAST_POLL))
+        later = when + datetime.timedelta(seconds=WATCH_SLOW_POLL)
+        if (next_start is not None and next_start < later):
+            return(next_start)
+        return(later)
+
+    # check for new results once.  returns True if there were some (and the reports that show them got rewritten).
+    def poll(self):
+        pipeline = self.pipeline
+        db = pipeline.db
+        self.polls += 1
+        pipeline.discover()
+        pipeline.fetch()
+        if (not pipeline.location_seasons):     # every page came back the same as last time (usually a 304)
+            return(False)
+
+        version = get_ingest_version(db)
+        pipeline.ingest()
+        pipeline.clean()
+        changed_locations = sorted(set(location for (location, season) in db.dirty_seasons))
+        pipeline.summarize()
+        if (get_ingest_version(db) == version):     # the page changed, but none of the scores on it did
+            return(False)
+        pipeline.report(changed_locations)
+        self.updates += 1
+        return(True)
+
+    # check, sleep until it's time to check again, repeat.  forever, or until there have been <polls> checks.
+    def watch(self, polls=None):
+        while (True):
+            try:
+                if (self.poll()):
+                    print("new results, reports updated ({:s})".format(self.now().strftime("%a %Y-%b-%d %H:%M")))
+            except OSError as e:        # the website (or the network) having a bad night.  try again next time.
+                print("couldn't check for new results ({:s})".format(str(e)))
+            if (polls is not None and self.polls >= polls):
+                return
+            when = self.next_poll(self.now())
+            if (VERBOSE): print("next check at " + when.strftime("%a %Y-%b-%d %H:%M"))
+            self.sleep(max(0.0, (when - self.now()).total_seconds()))
+
+# MAIN PROGRAM STARTS HERE
+#   python pub.py              update the database from the website and write out the reports
+#   python pub.py serve [port] serve the reports up out of the database, without touching the website
+#   python pub.py watch        keep checking the website, and update the database and reports whenever there are new results
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PubStumpers trivia scraper and stats")
+    parser.add_argument("command", nargs="?", choices=["run", "serve", "watch"], default="run")
+    parser.add_argument("port", nargs="?", type=int, default=SERVE_PORT, help="for serve (default: %(default)s)")
+    parser.add_argument("--profile", action="store_true", help="time every stage and query, print a summary and add a record to " + PROFILE_LOG)
+    parser.add_argument("--cprofile", metavar="FILE", help="also dump cProfile stats for the whole run to FILE")
+    args = parser.parse_args(argv)
+    start_time = datetime.datetime.now()
 
-for season in seasons:
-	get_season(season, PURGE_LAST_SEASON)
-for season in seasons:
-	parse_season(season)
-clean_database()
+    if (args.command == "serve"):
+        db = Database(shared=True)
+        serve(db, args.port)
+        db.close()
+        return(0)
 
-# print neat things about all that data
-writefile = open(HTMLFILE, "w")
-analyze_database()
-writefile.close()
+    if (args.command == "watch"):
+        watcher = Watcher()
+        print("watching for new results (Ctrl-C to stop)")
+        try:
+            watcher.watch()
+        except KeyboardInterrupt:
+            pass
+        watcher.pipeline.db.close()
+        return(0)
 
-# clean up shop
-conn.close()
+    pipeline = Pipeline(profile=args.profile)
+    profiler = cProfile.Profile() if args.cprofile else None
+    if (profiler is not None):
+        profiler.enable()
+    pipeline.run()
+    if (profiler is not None):
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+    if (args.profile):
+        record = pipeline.run_record()
+        record["cprofile"] = args.cprofile
+        with open(PROFILE_LOG, "a") as fh:
+            fh.write(json.dumps(record) + "\n")
+        print_run_record(record)
+    pipeline.db.close()     # clean up shop
 
-end_time = datetime.datetime.now()
-duration = end_time - start_time
-print("PROGRAM RAN FOR: " + str(duration))
+    end_time = datetime.datetime.now()
+    duration = end_time - start_time
+    print("PROGRAM RAN FOR: " + str(duration))
+    return(0)
 
-exit(0)
+if (__name__ == "__main__"):
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# tests for pub.py.  run with: python -m pytest -q
+#
+# everything runs in a scratch directory, against bench.py's stand-in website (so the real one never gets bothered)
+import pub
+import bench
+import pytest
+import datetime
+import http.server
+import threading
+import urllib.error
+
+LOCATION = pub.DEFAULT_LOCATION
+
+# a scratch directory, pub.py's module-level state put back the way a fresh run finds it,
+# and a stand-in website serving <site.pages> (season -> page bytes: change them to change the website)
+class Site:
+    def __init__(self, pages):
+        self.pages = pages
+        (self.server, self.url) = bench.serve_pages(pages)
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    site = Site(bench.make_pages(6, 12, 13))
+    monkeypatch.setattr(pub, "LOCATIONS", {LOCATION: site.url})
+    monkeypatch.setattr(pub, "page_cache", None)
+    monkeypatch.setattr(pub, "fetched_pages", {})
+    monkeypatch.setattr(pub, "archive_index", None)
+    monkeypatch.setattr(pub, "FETCH_BACKOFF", 0.01)
+    yield site
+    site.server.shutdown()
+    site.server.server_close()
+    pub.cached_table_rows.cache_clear()
+    pub.cached_snapshot.cache_clear()
+
+# what's in the database, in a form that compares equal to extract_season_rows' rows for the same page
+def stored_rows(db):
+    weekly = db.conn.execute("SELECT location, season, team, week, rank, score FROM weekly_results ORDER BY location, season, team, week").fetchall()
+    totals = db.conn.execute("SELECT location, season, team, score FROM season_results ORDER BY location, season, team").fetchall()
+    return(weekly, totals)
+
+def expected_rows(pages):
+    (weekly, totals) = ([], [])
+    for (season, page) in sorted(pages.items()):
+        (weekly_rows, season_rows) = pub.extract_season_rows(LOCATION, season, page.decode())
+        weekly.extend((location, int(season), team, week, rank, score) for (location, season, team, week, rank, score) in weekly_rows)
+        totals.extend((location, int(season), team, score) for (location, season, team, score) in season_rows)
+    return(sorted(weekly), sorted(totals))
+
+
+# a rebuild has to ingest the newest version of every page, even when the parse workers' copy of the archive index
+# (made before anything got fetched) still has an older one
+@pytest.mark.parametrize("parse_workers", [1, 2])
+def test_streamed_rebuild_reingests_changed_archived_page(site, parse_workers):
+    location_seasons = [(LOCATION, season) for season in sorted(site.pages)]
+    pub.fetch_seasons(location_seasons, True)
+    pub.load_archive_index()
+    for season in site.pages:
+        site.pages[season] = bench.season_page(season, 12, 13, 0, seed=1)
+
+    db = pub.Database("trivia.db", reset=True)
+    pub.stream_seasons(db, location_seasons, True, parse_workers=parse_workers)
+    assert stored_rows(db) == expected_rows(site.pages)
+    assert all(len(pub.page_versions(LOCATION, season)) == 2 for season in site.pages)
+    db.close()
+
+# rebuilding again from pages that are all archived and parsed already doesn't need any parse workers at all,
+# and a page that turns out to have changed in the meantime still gets parsed
+def test_streamed_rebuild_of_parsed_pages_starts_no_workers(site, monkeypatch):
+    location_seasons = [(LOCATION, season) for season in sorted(site.pages)]
+    pub.stream_seasons(pub.Database("trivia.db", reset=True), location_seasons, True, parse_workers=2)
+
+    def no_workers(workers):
+        raise AssertionError("started a process pool")
+    monkeypatch.setattr(pub, "parse_process_pool", no_workers)
+    site.pages[6] = bench.season_page(6, 12, 13, 0, seed=1)
+    db = pub.Database("trivia.db", reset=True)
+    pub.stream_seasons(db, location_seasons, True, parse_workers=2)
+    assert stored_rows(db) == expected_rows(site.pages)
+    db.close()
+
+
+# and the same goes for rebuilding one step at a time
+def test_parse_seasons_reads_newest_archived_page(site):
+    location_seasons = [(LOCATION, season) for season in sorted(site.pages)]
+    pub.fetch_seasons(location_seasons, True)
+    pub.load_archive_index()
+    for season in site.pages:
+        site.pages[season] = bench.season_page(season, 12, 13, 0, seed=1)
+    pub.fetch_seasons(location_seasons, True)
+
+    db = pub.Database("trivia.db", reset=True)
+    pub.parse_seasons(db, location_seasons, workers=2)
+    assert stored_rows(db) == expected_rows(site.pages)
+    db.close()
+
+# an install from before the page archive has its pages lying around as seasonN.html: they go in the archive
+# (as the default location's) instead of getting downloaded all over again
+def test_loose_season_pages_move_into_archive(site, tmp_path):
+    for (season, page) in site.pages.items():
+        (tmp_path / "season{:d}.html".format(season)).write_bytes(page)
+    pages = dict(site.pages)
+    site.pages.clear()                  # the website's down: anything that isn't already here can't be had
+    assert pub.fetch_seasons([(LOCATION, season) for season in sorted(pages)]) == []
+    for (season, page) in pages.items():
+        assert not (tmp_path / "season{:d}.html".format(season)).exists()
+        assert len(pub.page_versions(LOCATION, season)) == 1
+        with pub.open_page(LOCATION, season) as fh:
+            assert fh.read() == page.decode()
+
+
+# settings changed after import count, same as if they'd been edited in the file
+def test_settings_are_read_when_used(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pub, "DATABASE", "other.db")
+    monkeypatch.setattr(pub, "RESET_DATABASE", True)
+    monkeypatch.setattr(pub, "PURGE_LAST_SEASON", False)
+    monkeypatch.setattr(pub, "STREAM_INGEST", False)
+    pipeline = pub.Pipeline()
+    assert (pipeline.db.path, pipeline.reset, pipeline.purge_last_season, pipeline.stream) == ("other.db", True, False, False)
+    monkeypatch.setattr(pub, "SELECTED_TEAM", "somebody else")
+    assert 'BGCOLOR="ffff00"' in "".join(pub.render_table("title", ["Place", "Team"], [(1, "somebody else")]))
+
+
+# team names come off the website, so they get escaped like anything else going in a page
+def test_render_table_escapes_team_names():
+    page = "".join(pub.render_table("title", ["Place", "Team"], [(1, "<script>&co"), (2, "bob's team")], team="nobody"))
+    assert "&lt;Script&gt;&amp;Co" in page and "<Script>" not in page
+    assert "Bob's Team" in page
+
+
+# both parser backends have to turn a page into exactly the same rows; lxml is the reference, and these are the
+# kinds of markup it takes in stride (no whitespace between cells, comments between or inside them)
+PAGE = bench.season_page(3, 12, 13, 2).decode()
+PAGE_VARIANTS = {
+    "as served": PAGE,
+    "no whitespace between cells": PAGE.replace(">\n<td", "><td"),
+    "comment between cells": PAGE.replace("</td>\n<td", "</td><!-- score -->\n<td"),
+    "comment inside cells": PAGE.replace("</td>\n<td", "<!-- score --></td>\n<td"),
+}
+
+@pytest.mark.parametrize("variant", sorted(PAGE_VARIANTS))
+def test_parser_backends_agree(variant):
+    expected = pub.extract_season_rows(LOCATION, 3, PAGE, backend="lxml")
+    assert len(expected[1]) == 12
+    assert pub.extract_season_rows(LOCATION, 3, PAGE_VARIANTS[variant], backend="lxml") == expected
+    assert pub.extract_season_rows(LOCATION, 3, PAGE_VARIANTS[variant], backend="bs4") == expected
+
+# a rebuild's run record counts the pages that actually changed, not every page it asked for
+@pytest.mark.parametrize("stream", [True, False])
+def test_rebuild_counts_changed_pages(site, monkeypatch, stream):
+    monkeypatch.setattr(pub, "DISCOVER_LAST_SEASON", False)
+    monkeypatch.setattr(pub, "LAST_SEASON", 6)
+    pipeline = pub.Pipeline(pub.Database("trivia.db", reset=True), reset=True, stream=stream)
+    pipeline.run()
+    assert (pipeline.run_record()["pages_asked_for"], pipeline.run_record()["pages_changed"]) == (6, 6)
+
+    site.pages[4] = bench.season_page(4, 12, 13, 0, seed=1)
+    pipeline = pub.Pipeline(pub.Database("trivia.db", reset=True), reset=True, stream=stream)
+    pipeline.run()
+    assert (pipeline.run_record()["pages_asked_for"], pipeline.run_record()["pages_changed"]) == (6, 1)
+    pipeline.db.close()
+
+
+# a location that's listed but hasn't got any results yet mustn't take the other reports (or the leaderboard) down with it
+def test_report_for_location_with_no_results(site, monkeypatch):
+    pipeline = pub.Pipeline(pub.Database("trivia.db", reset=True), reset=True)
+    pipeline.discover()
+    pipeline.fetch_and_ingest()
+    monkeypatch.setattr(pub, "LOCATIONS", {LOCATION: site.url, "newpub": site.url})
+    pipeline.summarize()
+    pipeline.report()
+
+    with open(pub.report_file("newpub")) as fh:
+        assert "Last week processed: none yet." in fh.read()
+    with open(pub.report_file(LOCATION)) as fh:
+        assert "Last week processed: Season 6, Week 13." in fh.read()
+    with open(pub.LEADERBOARD_FILE) as fh:
+        assert pub.report_file("newpub") in fh.read()
+
+    statuses = []
+    app = pub.make_report_app(pipeline.db)
+    body = b"".join(app({"PATH_INFO": "/" + pub.report_file("newpub")}, lambda status, headers: statuses.append(status)))
+    assert statuses == ["200 OK"] and b"none yet" in body
+    pipeline.db.close()
+
+
+# a website that answers with whatever's next in <statuses> (then the last one, forever), counting how often it got asked
+class FlakySite(http.server.BaseHTTPRequestHandler):
+    statuses = []
+    requests = 0
+
+    def do_GET(self):
+        FlakySite.requests += 1
+        status = FlakySite.statuses.pop(0) if len(FlakySite.statuses) > 1 else FlakySite.statuses[0]
+        self.send_response(status)
+        self.end_headers()
+        self.wfile.write(b"page" if status == 200 else b"nope")
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def flaky_site(monkeypatch):
+    monkeypatch.setattr(pub, "FETCH_BACKOFF", 0.01)
+    monkeypatch.setattr(FlakySite, "requests", 0)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlakySite)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{:d}/".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+# the website having a bad moment: ask again
+def test_download_page_retries_server_errors(flaky_site, monkeypatch):
+    monkeypatch.setattr(FlakySite, "statuses", [503, 500, 200])
+    (data, headers) = pub.download_page(flaky_site)
+    assert data == b"page" and FlakySite.requests == 3
+
+def test_download_page_gives_up_after_retries(flaky_site, monkeypatch):
+    monkeypatch.setattr(FlakySite, "statuses", [502])
+    with pytest.raises(urllib.error.HTTPError):
+        pub.download_page(flaky_site)
+    assert FlakySite.requests == pub.FETCH_RETRIES + 1
+
+# a page that isn't there isn't going to turn up by asking again
+def test_download_page_doesnt_retry_missing_page(flaky_site, monkeypatch):
+    monkeypatch.setattr(FlakySite, "statuses", [404, 200])
+    with pytest.raises(urllib.error.HTTPError) as error:
+        pub.download_page(flaky_site)
+    assert error.value.code == 404 and FlakySite.requests == 1
+
+
+# Watcher's idea of when to check next.  2026-10-19 is a Monday.
+def at(day, hour, minute=0):
+    return(datetime.datetime(2026, 10, day, hour, minute))
+
+@pytest.mark.parametrize("results_posted, when, expected", [
+    ([(1, 20, 24)], at(20, 19, 0), at(20, 20, 0)),          # the window's about to open: check right when it does
+    ([(1, 20, 24)], at(20, 20, 0), at(20, 20, 5)),          # it's open (from the very start): check often
+    ([(1, 20, 24)], at(20, 23, 58), at(21, 0, 3)),          # the last check in the window can land just past it
+    ([(1, 20, 24)], at(21, 0, 0), at(21, 6, 0)),            # it's closed (right at the end): check now and then
+    ([(1, 20, 24)], at(26, 22, 0), at(27, 4, 0)),           # next week's window is more than a slow poll away
+    ([(1, 20, 24)], at(27, 17, 0), at(27, 20, 0)),          # Tuesday again, the week after
+    ([(1, 20, 26)], at(21, 1, 0), at(21, 1, 5)),            # until past 24 runs on into Wednesday...
+    ([(1, 20, 26)], at(21, 2, 0), at(21, 8, 0)),            # ...and no further
+    ([(6, 22, 26)], at(26, 1, 0), at(26, 1, 5)),            # Sunday night into Monday morning, seen from the Monday
+    ([(6, 22, 26)], at(25, 23, 0), at(25, 23, 5)),          # ...and from the Sunday
+    ([(6, 22, 26)], at(26, 2, 0), at(26, 8, 0)),            # closed again once it's over
+    ([(6, 22, 26)], at(25, 18, 0), at(25, 22, 0)),          # about to open
+    ([(1, 20, 24), (4, 19, 22)], at(21, 12, 0), at(21, 18, 0)),     # more than one window: Friday's is next, but a ways off
+    ([(1, 20, 24), (4, 19, 22)], at(23, 17, 0), at(23, 19, 0)),
+])
+def test_next_poll(monkeypatch, results_posted, when, expected):
+    monkeypatch.setattr(pub, "RESULTS_POSTED", results_posted)
+    monkeypatch.setattr(pub, "WATCH_FAST_POLL", 5 * 60)
+    monkeypatch.setattr(pub, "WATCH_SLOW_POLL", 6 * 60 * 60)
+    assert pub.Watcher(pipeline=object()).next_poll(when) == expected
+
+# a clock that only moves when the watcher sleeps
+class FakeClock:
+    def __init__(self, when):
+        self.when = when
+        self.naps = []
+
+    def now(self):
+        return(self.when)
+
+    def sleep(self, seconds):
+        self.naps.append(seconds)
+        self.when += datetime.timedelta(seconds=seconds)
+
+def test_watcher_only_updates_for_new_results(site, monkeypatch):
+    monkeypatch.setattr(pub, "DISCOVER_LAST_SEASON", False)
+    monkeypatch.setattr(pub, "LAST_SEASON", 6)
+    site.pages[6] = bench.season_page(6, 12, 13, 2)       # the newest season's last two weeks aren't in yet
+    other = Site(bench.make_pages(6, 12, 13, seed=2))
+    monkeypatch.setattr(pub, "LOCATIONS", {LOCATION: site.url, "other": other.url})
+    pub.Pipeline(pub.Database("trivia.db", reset=True), reset=True).run()
+
+    clock = FakeClock(at(19, 12))
+    watcher = pub.Watcher(pub.Pipeline(pub.Database("trivia.db"), reset=False, purge_last_season=True), now=clock.now, sleep=clock.sleep)
+    assert watcher.poll() is False          # nothing new
+    site.pages[6] = site.pages[6].replace(b"&copy; PubStumpers", b"&copy; PubStumpers 2026")
+    assert watcher.poll() is False          # a new page, but the same results
+
+    # week 12 goes up, but the other location's website is down, so the whole check fails...
+    site.pages[6] = bench.season_page(6, 12, 13, 1)
+    other_page = other.pages.pop(6)
+    with pytest.raises(urllib.error.HTTPError):
+        watcher.poll()
+    assert pub.get_last_week(watcher.pipeline.db, LOCATION) == (6, 11)
+    # ...and once it's back, week 12 still counts as new
+    other.pages[6] = other_page
+    assert watcher.poll() is True
+    assert pub.get_last_week(watcher.pipeline.db, LOCATION) == (6, 12)
+    with open(pub.report_file(LOCATION)) as fh:
+        assert "Season 6, Week 12." in fh.read()
+
+    watcher.watch(polls=watcher.polls + 2)
+    assert (watcher.polls, watcher.updates) == (6, 1)
+    assert clock.naps == [6 * 60 * 60]      # Monday noon: nowhere near a window, so a slow poll
+    watcher.pipeline.db.close()
+    other.server.shutdown()
+    other.server.server_close()